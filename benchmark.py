@@ -0,0 +1,550 @@
+"""
+Benchmark del pipeline de rotación sin GCP ni ControlRoll.
+
+Genera un payload sintético de ControlRoll (con semilla), lo sirve desde un
+servidor HTTP local que reemplaza a API_LOCAL_URL y ejecuta las etapas del
+pipeline (descarga, decodificación, normalización, bridge y carga) contra un
+cliente BigQuery en memoria. Por cada etapa se mide el tiempo y el pico de
+memoria residente, y el resultado se puede guardar como baseline o comparar
+contra uno guardado.
+
+Uso:
+    python benchmark.py --employees 40000 --years 12 --save-baseline benchmark_baseline.json
+    python benchmark.py --employees 40000 --years 12 --baseline benchmark_baseline.json
+"""
+import argparse
+import gc
+import gzip
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STAGES = ["download", "decode", "normalize", "bridge", "load", "rollups", "reload"]
+# Modo de intervalos: las rollups se calculan en BigQuery sobre la vista, el cliente falso no las mide
+INTERVAL_STAGES = ["download", "decode", "normalize", "intervals", "load", "reload"]
+# Carga por chunks: el bridge se genera y se sube en la misma etapa (rollups incluidas)
+PIPELINED_STAGES = ["download", "decode", "normalize", "pipelined", "rollups", "reload"]
+
+
+def generate_payload(employees=20000, years=10, termination_rate=0.6,
+                     part_time_rate=0.1, rehire_rate=0.03, seed=42) -> bytes:
+    """
+    Genera el JSON de ControlRoll para `employees` filas con `years` años de historia.
+
+    Usa los encabezados originales del reporte (con tildes, espacios y columnas
+    que el pipeline descarta), mezcla fechas 'YYYY-MM-DD', 'DD-MM-YYYY' y
+    'DD/MM/YYYY' y deja vacíos los finiquitos de los activos. Una fracción de
+    los ruts se repite para simular recontrataciones.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    start = date(today.year - years, 1, 1)
+    span = (today - start).days
+    clientes = [f"CLIENTE {i}" for i in range(60)]
+    instalaciones = [f"INSTALACION {i}" for i in range(800)]
+    cecos = [f"CC-{i:04d}" for i in range(300)]
+    cargos = [f"CARGO {i}" for i in range(120)]
+    causales = [
+        (1, "Renuncia voluntaria"), (2, "Mutuo acuerdo"), (3, "Vencimiento del plazo"),
+        (4, "Necesidades de la empresa"), (9999, "Inactivar sin Movimiento"),
+    ]
+    date_formats = ["%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y"]
+
+    records = []
+    for i in range(employees):
+        rut_num = rng.randrange(i) if i and rng.random() < rehire_rate else i
+        ingreso = start + timedelta(days=rng.randrange(span))
+        finiquito = None
+        if rng.random() < termination_rate:
+            finiquito = min(ingreso + timedelta(days=rng.randint(0, 1500)), today)
+        causal = rng.choice(causales) if finiquito else (None, None)
+        fmt = rng.choices(date_formats, weights=[6, 3, 1])[0]
+        cliente = rng.randrange(len(clientes))
+        instalacion = rng.randrange(len(instalaciones))
+        records.append({
+            "RUT": f"{10000000 + rut_num}-{rut_num % 10}",
+            "NOMBRE COMPLETO": f"NOMBRE {rut_num} APELLIDO {rut_num % 997}",
+            "CLIENTE": clientes[cliente],
+            "CECOS": rng.choice(cecos),
+            "CECOSORIGEN": rng.choice(cecos),
+            "CARGO": rng.choice(cargos),
+            "TIPO EMPLEADO": "PART TIME BOLETA" if rng.random() < part_time_rate
+            else rng.choice(["PLANTA", "PLAZO FIJO"]),
+            "ESTADO": "Finiquitado" if finiquito else "Activo",
+            "INSTALACIÓN": instalaciones[instalacion],
+            "FECHA DE INGRESO": ingreso.strftime(fmt),
+            "FECHA_FINIQUITO": finiquito.strftime(fmt) if finiquito else "",
+            "COD. CAUSAL FINIQUITO": causal[0],
+            "CAUSAL FINIQUITO": causal[1],
+            "DIRECCIÓN": f"Calle {rng.randrange(5000)} #{rng.randrange(999)}",
+            "N° CUENTA": str(rng.randrange(10 ** 9)),
+        })
+    return json.dumps(records, ensure_ascii=False).encode("utf-8")
+
+
+def serve_payload(body: bytes, compress=False, etag=None, fail_first=0, truncate_first=0, delay=0.0):
+    """
+    Levanta un servidor HTTP local que responde `body` a cualquier GET. Retorna (server, url).
+
+    Sirve también de reemplazo de ControlRoll para probar el cliente:
+    `compress` responde gzip si el pedido lo acepta; `etag` habilita 304
+    ante If-None-Match y rangos (`Range` + `If-Range`, sin comprimir);
+    `fail_first` responde 503 a los primeros pedidos; `truncate_first` corta
+    la conexión a mitad del cuerpo en los pedidos siguientes; `delay` espera
+    esos segundos antes de cada bloque de 64 KiB. `server.requests` guarda
+    los encabezados de cada pedido recibido.
+    """
+    state = {"served": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            server.requests.append(dict(self.headers))
+            state["served"] += 1
+            n = state["served"]
+            if n <= fail_first:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if etag and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            payload, status, extra = body, 200, {}
+            range_header = self.headers.get("Range")
+            if etag and range_header and self.headers.get("If-Range") == etag:
+                start = int(range_header.split("=")[1].split("-")[0])
+                payload, status = body[start:], 206
+                extra["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+            elif compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+                payload = gzip.compress(body, compresslevel=5)
+                extra["Content-Encoding"] = "gzip"
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Accept-Ranges", "bytes")
+            for name, value in extra.items():
+                self.send_header(name, value)
+            self.end_headers()
+
+            limit = len(payload) // 2 if n <= fail_first + truncate_first else len(payload)
+            for offset in range(0, limit, 64 * 1024):
+                if delay:
+                    time.sleep(delay)
+                self.wfile.write(payload[offset:min(offset + 64 * 1024, limit)])
+            if limit < len(payload):
+                self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/report"
+
+
+def _job(result=None):
+    """Job ya terminado, con el `.result()` que esperan los llamadores."""
+    return SimpleNamespace(result=lambda: result)
+
+
+class FakeBigQueryClient:
+    """
+    Cliente BigQuery en memoria con lo que usa BigQuerySink para la carga completa.
+
+    Los archivos Parquet subidos se leen de vuelta a tablas Arrow por
+    partición, de modo que la serialización y el tamaño de subida se miden
+    igual que contra BigQuery.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.checksums = {}
+        self.uploaded_bytes = 0
+
+    def get_table(self, table_id):
+        if table_id not in self.tables:
+            raise KeyError(table_id)
+        return SimpleNamespace(time_partitioning=SimpleNamespace(field="month_start"), table_type="TABLE")
+
+    def list_partitions(self, table_id):
+        return sorted(self.tables.get(table_id, {}))
+
+    def query(self, query, job_config=None):
+        rows = [{"partition_id": pid, "checksum": c} for pid, c in self.checksums.items()]
+        return _job(rows)
+
+    def load_table_from_file(self, f, destination, job_config=None):
+        from sinks import split_partitions
+
+        data = f.read()
+        self.uploaded_bytes += len(data)
+        table = pq.read_table(pa.BufferReader(data))
+        table_id, _, pid = destination.partition("$")
+        if pid:
+            self.tables.setdefault(table_id, {})[pid] = table
+        elif job_config is not None and job_config.write_disposition == "WRITE_APPEND":
+            current = self.tables.setdefault(table_id, {})
+            for pid, part in split_partitions(table).items():
+                current[pid] = pa.concat_tables([current[pid], part]) if pid in current else part
+        elif job_config is not None and job_config.time_partitioning is None:
+            self.tables[table_id] = {"": table}
+        else:
+            self.tables[table_id] = split_partitions(table)
+        return _job()
+
+    def load_table_from_dataframe(self, df, destination, job_config=None):
+        self.checksums = dict(zip(df["partition_id"], df["checksum"]))
+        return _job()
+
+    def copy_table(self, source, destination, job_config=None):
+        self.tables[destination] = dict(self.tables[source])
+        return _job()
+
+    def delete_table(self, table_id, not_found_ok=False):
+        table_id, _, pid = table_id.partition("$")
+        if pid:
+            self.tables.get(table_id, {}).pop(pid, None)
+        else:
+            self.tables.pop(table_id, None)
+
+
+def _rss_bytes() -> int:
+    """Memoria residente actual del proceso (o el máximo histórico si no hay /proc)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakMemory:
+    """Muestrea la memoria residente en un hilo mientras dura el bloque y guarda el pico."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def _run_once(pipeline, sinks, verbose=False, output_mode="bridge") -> dict:
+    """Ejecuta el pipeline completo una vez y retorna tiempo, pico de memoria y filas por etapa."""
+    client = FakeBigQueryClient()
+    sink = sinks.BigQuerySink("bench", "bench", "rotacion", client=client)
+    state = {}
+    steps = {
+        "download": lambda: state.update(meta=pipeline.download_payload(force_refresh=True)),
+        "decode": lambda: state.update(data=pipeline.read_payload(state["meta"])),
+        "normalize": lambda: state.update(norm=pipeline.prepare_employees(state.pop("data"))),
+        "bridge": lambda: state.update(bridge=pipeline.build_bridge(state.pop("norm"))[pipeline.BRIDGE_COLUMNS]),
+        "load": lambda: pipeline.load_to_bigquery(state["bridge"], sink=sink),
+        "rollups": lambda: pipeline.load_rollups(state["bridge"], sink=sink),
+        "reload": lambda: pipeline.load_to_bigquery(state["bridge"], sink=sink),
+    }
+    rows = {
+        "download": lambda: state["meta"]["bytes"],
+        "decode": lambda: len(state["data"]),
+        "normalize": lambda: len(state["norm"]),
+        "bridge": lambda: len(state["bridge"]),
+        "load": lambda: client.uploaded_bytes,
+        "rollups": lambda: client.uploaded_bytes,
+        "reload": lambda: client.uploaded_bytes,
+    }
+    if output_mode == "pipelined":
+        steps.update({
+            "pipelined": lambda: state.update(rollups=pipeline.load_pipelined(state["norm"], sink=sink, rollups=True)[1]),
+            "rollups": lambda: pipeline.load_rollups(None, sink=sink, rollups=state["rollups"]),
+            "reload": lambda: pipeline.load_pipelined(state["norm"], sink=sink),
+        })
+        rows["pipelined"] = lambda: client.uploaded_bytes
+        return _measure(PIPELINED_STAGES, steps, rows)
+    if output_mode == "intervals":
+        steps.update({
+            "intervals": lambda: state.update(intervals=pipeline.build_intervals(state.pop("norm"))),
+            "load": lambda: pipeline.load_intervals(*state["intervals"], sink=sink),
+            "reload": lambda: pipeline.load_intervals(*state["intervals"], sink=sink),
+        })
+        rows["intervals"] = lambda: len(state["intervals"][0])
+        return _measure(INTERVAL_STAGES, steps, rows)
+    return _measure(STAGES, steps, rows)
+
+
+def _measure(stages, steps, rows) -> dict:
+    """Ejecuta las etapas en orden y mide tiempo, pico de memoria y volumen de cada una."""
+    results = {}
+    for name in stages:
+        gc.collect()
+        with PeakMemory() as mem:
+            t0 = time.perf_counter()
+            steps[name]()
+            seconds = time.perf_counter() - t0
+        results[name] = {
+            "seconds": round(seconds, 3),
+            "peak_rss_mb": round(mem.peak / 1024 ** 2, 1),
+            "volume": rows[name](),
+        }
+    return results
+
+
+def run_benchmark(employees=20000, years=10, termination_rate=0.6, part_time_rate=0.1,
+                  seed=42, repeat=1, verbose=False, output_mode="bridge") -> dict:
+    """
+    Genera el payload, apunta el pipeline al servidor local y ejecuta `repeat` corridas.
+
+    Por etapa se reporta la mediana de tiempo y el mayor pico de memoria
+    residente. `volume` es la cantidad procesada por la etapa: bytes del
+    payload (download), filas (decode, normalize, bridge) o bytes subidos
+    acumulados (load, rollups, reload).
+    """
+    body = generate_payload(employees, years, termination_rate, part_time_rate, seed=seed)
+    server, url = serve_payload(body)
+    workdir = tempfile.mkdtemp(prefix="rotacion_bench_")
+    os.environ.update({
+        "API_LOCAL_URL": url,
+        "TOKEN_CR": "benchmark",
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "SNAPSHOT_PATH": os.path.join(workdir, "snapshot.parquet"),
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import pipeline
+    import sinks
+
+    if not verbose:
+        logging.getLogger("rotacion").setLevel(logging.WARNING)
+
+    try:
+        runs = [_run_once(pipeline, sinks, verbose, output_mode) for _ in range(repeat)]
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    stages = {
+        name: {
+            "seconds": round(statistics.median(r[name]["seconds"] for r in runs), 3),
+            "peak_rss_mb": max(r[name]["peak_rss_mb"] for r in runs),
+            "volume": runs[-1][name]["volume"],
+        }
+        for name in runs[0]
+    }
+    return {
+        "params": {
+            "employees": employees, "years": years, "termination_rate": termination_rate,
+            "part_time_rate": part_time_rate, "seed": seed, "output_mode": output_mode,
+        },
+        "payload_bytes": len(body),
+        "bridge_rows": stages["bridge"]["volume"] if "bridge" in stages else None,
+        "total_seconds": round(sum(s["seconds"] for s in stages.values()), 3),
+        "peak_rss_mb": max(s["peak_rss_mb"] for s in stages.values()),
+        "stages": stages,
+    }
+
+
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "google.cloud.bigquery", "requests"]
+
+
+def _import_seconds(module, cwd) -> float:
+    """Tiempo acumulado de importar `module` en un intérprete nuevo, según -X importtime."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    ).stderr
+    line = next(row for row in reversed(out.splitlines()) if row.rstrip().endswith(f"| {module}"))
+    return int(line.split("|")[1]) / 1e6
+
+
+def _get(url, timeout=1.0):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.status, response.read().decode()
+
+
+def _startup_gauges(metrics_text) -> dict:
+    prefix = 'rotacion_startup_seconds{phase="'
+    return {
+        line[len(prefix):line.index('"}')]: float(line.rsplit(" ", 1)[1])
+        for line in metrics_text.splitlines() if line.startswith(prefix)
+    }
+
+
+def cold_start(repeat=3, timeout=60.0) -> dict:
+    """
+    Mide el arranque en frío del servicio tal como lo lanza el Dockerfile (`python main.py`).
+
+    Por corrida se lanza un proceso nuevo y se mide el tiempo hasta la
+    primera respuesta 200 de `/health` y hasta que el warm-up termina de
+    importar el pipeline (leído de `/metrics`). Además reporta el tiempo de
+    importar `main` y `pipeline` en un intérprete limpio y qué módulos
+    pesados quedan cargados solo con importar `main`.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    loaded = subprocess.run(
+        [sys.executable, "-c", f"import main, sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"],
+        cwd=root, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+    runs = []
+    for _ in range(repeat):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        env = {**os.environ, "PORT": str(port), "LOAD_SINK": "local", "LOG_LEVEL": "WARNING"}
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "main.py"], cwd=root, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            first_response = pipeline_ready = None
+            gauges = {}
+            while time.perf_counter() - t0 < timeout and pipeline_ready is None:
+                try:
+                    if first_response is None:
+                        _get(f"http://127.0.0.1:{port}/health")
+                        first_response = time.perf_counter() - t0
+                    gauges = _startup_gauges(_get(f"http://127.0.0.1:{port}/metrics")[1])
+                    if "pipeline_import" in gauges:
+                        pipeline_ready = time.perf_counter() - t0
+                except OSError:
+                    pass
+                time.sleep(0.01)
+        finally:
+            proc.terminate()
+            proc.wait()
+        if first_response is None:
+            raise RuntimeError(f"El servicio no respondió /health en {timeout}s")
+        runs.append({
+            "time_to_first_response_s": round(first_response, 3),
+            "time_to_pipeline_ready_s": round(pipeline_ready, 3) if pipeline_ready else None,
+            "app_import_s": gauges.get("app_import"),
+            "pipeline_import_s": gauges.get("pipeline_import"),
+        })
+
+    summary = {
+        key: round(statistics.median(r[key] for r in runs), 3) if all(r[key] is not None for r in runs) else None
+        for key in runs[0]
+    }
+    return {
+        **summary,
+        "import_main_s": round(_import_seconds("main", root), 3),
+        "import_pipeline_s": round(_import_seconds("pipeline", root), 3),
+        "heavy_modules_after_import_main": loaded.split(",") if loaded else [],
+        "runs": runs,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Imprime la comparación contra el baseline y retorna las regresiones.
+
+    Una etapa regresiona si su tiempo o su pico de memoria supera al del
+    baseline en más de `tolerance` (fracción).
+    """
+    if baseline.get("params") != result["params"]:
+        print(f"⚠️ Parámetros distintos al baseline: {baseline.get('params')} vs {result['params']}")
+
+    regressions = []
+    print(f"{'etapa':<10} {'seg':>8} {'base':>8} {'Δ%':>7}   {'MB':>8} {'base':>8} {'Δ%':>7}")
+    rows = [(name, stage, baseline["stages"].get(name)) for name, stage in result["stages"].items()]
+    rows.append(("total", {"seconds": result["total_seconds"], "peak_rss_mb": result["peak_rss_mb"]},
+                 {"seconds": baseline["total_seconds"], "peak_rss_mb": baseline["peak_rss_mb"]}))
+    for name, current, base in rows:
+        if base is None:
+            print(f"{name:<10} {current['seconds']:>8.3f} {'-':>8}")
+            continue
+        deltas = {}
+        for metric in ("seconds", "peak_rss_mb"):
+            deltas[metric] = (current[metric] - base[metric]) / base[metric] if base[metric] else 0.0
+            if deltas[metric] > tolerance:
+                regressions.append(f"{name}.{metric}: {base[metric]} -> {current[metric]}")
+        print(f"{name:<10} {current['seconds']:>8.3f} {base['seconds']:>8.3f} {deltas['seconds']:>+7.1%}   "
+              f"{current['peak_rss_mb']:>8.1f} {base['peak_rss_mb']:>8.1f} {deltas['peak_rss_mb']:>+7.1%}")
+    return regressions
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline de rotación")
+    parser.add_argument("--employees", type=int, default=20000)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--termination-rate", type=float, default=0.6)
+    parser.add_argument("--part-time-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--baseline", help="JSON de un benchmark anterior para comparar")
+    parser.add_argument("--save-baseline", help="Guarda el resultado como baseline en esta ruta")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Regresión máxima aceptada por etapa (fracción, por defecto 0.15)")
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs del pipeline")
+    parser.add_argument("--output-mode", choices=["bridge", "intervals", "pipelined"], default="bridge",
+                        help="Carga el bridge (por defecto), los intervalos con la vista o el bridge por chunks")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="Mide el arranque en frío del servicio en vez del pipeline")
+    args = parser.parse_args(argv)
+
+    if args.cold_start:
+        print(json.dumps(cold_start(repeat=args.repeat), indent=2))
+        return 0
+
+    result = run_benchmark(
+        employees=args.employees, years=args.years, termination_rate=args.termination_rate,
+        part_time_rate=args.part_time_rate, seed=args.seed, repeat=args.repeat, verbose=args.verbose,
+        output_mode=args.output_mode,
+    )
+    print(json.dumps(result, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Baseline guardado en {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print("❌ Regresiones sobre el baseline:")
+            for r in regressions:
+                print(f"   {r}")
+            return 1
+        print("✅ Sin regresiones sobre el baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,145 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+# Columnas con índice invertido (valor -> filas) en el índice en memoria
+INDEXED_COLUMNS = ["period", "tenant", "cliente", "instalacion", "cecos", "rut"]
+
+KPI_FLAGS = ["active_on_month_start", "active_on_month_end", "hire_in_month", "term_in_month", "active_ratio"]
+
+
+def kpi_aggregate(df: pd.DataFrame, keys) -> pd.DataFrame:
+    """
+    KPI de rotación por grupo: dotación al inicio y al cierre, ingresos,
+    finiquitos, FTE (suma de active_ratio) y tasa de rotación = finiquitos /
+    dotación promedio (inicio + cierre) / 2, nula si la dotación promedio es cero.
+
+    Agrupa con observed=True para no materializar combinaciones vacías de las
+    categóricas.
+    """
+    g = df.groupby(list(keys), observed=True, sort=True)
+    # Las sumas de flags int8 pueden volver como int8 según los valores; se
+    # llevan a int64 antes de operar entre ellas
+    out = pd.DataFrame({
+        "headcount_start": g["active_on_month_start"].sum().astype(np.int64),
+        "headcount_end": g["active_on_month_end"].sum().astype(np.int64),
+        "hires": g["hire_in_month"].sum().astype(np.int64),
+        "terminations": g["term_in_month"].sum().astype(np.int64),
+        "fte": g["active_ratio"].sum().astype(np.float64),
+    })
+    average = (out["headcount_start"] + out["headcount_end"]) / 2
+    out["rotation_rate"] = (out["terminations"] / average).where(average > 0)
+    return out.reset_index()
+
+
+def _codes_dtype(n_categories):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+class BridgeIndex:
+    """
+    Copia compacta del último bridge con índices por columna para consultas en memoria.
+
+    Las columnas de texto se guardan como códigos enteros + categorías, las
+    fechas como datetime64[D] y las métricas con su dtype angosto. Para cada
+    columna de INDEXED_COLUMNS se precalcula una lista de posiciones por valor
+    (argsort estable de los códigos + offsets), de modo que filtrar por un
+    valor es un slice y combinar filtros es una intersección de arreglos
+    ordenados. El índice no se modifica después de construido; para
+    actualizarlo se construye uno nuevo y se reemplaza la referencia.
+    """
+
+    def __init__(self, df_bridge: pd.DataFrame, columns, source=None):
+        self.n_rows = len(df_bridge)
+        self.columns = {}
+        self.categories = {}
+        for col in columns:
+            s = df_bridge[col]
+            if isinstance(s.dtype, pd.CategoricalDtype) or s.dtype == object:
+                cat = s.cat if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category").cat
+                categories = cat.categories.astype(str)
+                self.categories[col] = categories
+                self.columns[col] = cat.codes.to_numpy().astype(_codes_dtype(len(categories)))
+            elif pd.api.types.is_datetime64_any_dtype(s):
+                self.columns[col] = s.to_numpy().astype("datetime64[D]")
+            else:
+                self.columns[col] = s.to_numpy()
+
+        self.postings = {}
+        for col in INDEXED_COLUMNS:
+            codes = self.columns[col]
+            order = np.argsort(codes, kind="stable").astype(np.int32)
+            # Los nulos (código -1) quedan al inicio y se saltan con el offset 0
+            counts = np.bincount(codes.astype(np.int64) + 1, minlength=len(self.categories[col]) + 1)
+            self.postings[col] = (order, np.concatenate([[0], np.cumsum(counts)]))
+
+        self.source = source or {}
+        self.built_at = time.time()
+
+    def _positions(self, col, values) -> np.ndarray:
+        """Filas (ordenadas) donde `col` toma alguno de `values`."""
+        order, offsets = self.postings[col]
+        codes = self.categories[col].get_indexer(list(values))
+        parts = [order[offsets[c + 1]:offsets[c + 2]] for c in codes[codes >= 0]]
+        if not parts:
+            return np.empty(0, dtype=np.int32)
+        return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+
+    def select(self, filters=None, period_from=None, period_to=None) -> np.ndarray:
+        """
+        Filas que cumplen todos los filtros: `filters` es {columna indexada:
+        lista de valores} y el rango de períodos 'YYYY-MM' es inclusivo.
+        """
+        selections = [
+            self._positions(col, values)
+            for col, values in (filters or {}).items() if values
+        ]
+        if period_from or period_to:
+            periods = self.categories["period"]
+            in_range = np.ones(len(periods), dtype=bool)
+            if period_from:
+                in_range &= periods >= period_from
+            if period_to:
+                in_range &= periods <= period_to
+            selections.append(self._positions("period", periods[in_range]))
+        if not selections:
+            return np.arange(self.n_rows, dtype=np.int32)
+
+        selections.sort(key=len)
+        result = selections[0]
+        for positions in selections[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, positions, assume_unique=True)
+        return result
+
+    def frame(self, positions, columns=None) -> pd.DataFrame:
+        """DataFrame con las filas pedidas; las columnas de texto vuelven como categóricas."""
+        data = {}
+        for col in columns or self.columns:
+            values = self.columns[col][positions]
+            if col in self.categories:
+                values = pd.Categorical.from_codes(values, categories=self.categories[col])
+            data[col] = values
+        return pd.DataFrame(data)
+
+    def aggregate(self, positions, group_by) -> pd.DataFrame:
+        """KPI de rotación de las filas seleccionadas agrupados por `group_by`."""
+        return kpi_aggregate(self.frame(positions, list(group_by) + KPI_FLAGS), group_by)
+
+    def memory_report(self) -> dict:
+        """Bytes ocupados por las columnas, las categorías y los índices."""
+        columns = sum(values.nbytes for values in self.columns.values())
+        categories = sum(int(c.memory_usage(deep=True)) for c in self.categories.values())
+        indexes = sum(order.nbytes + offsets.nbytes for order, offsets in self.postings.values())
+        return {
+            "rows": self.n_rows,
+            "columns_bytes": columns,
+            "categories_bytes": categories,
+            "index_bytes": indexes,
+            "total_bytes": columns + categories + indexes,
+        }
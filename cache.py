@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+
+class PayloadCache:
+    """
+    Cache en disco del payload crudo de ControlRoll y del bridge procesado.
+
+    El payload se guarda comprimido con gzip bajo una clave derivada de
+    (URL, método, día) y expira a los `ttl_seconds`. El bridge se guarda en
+    Parquet asociado al hash de contenido del payload y al día de proceso,
+    porque el fin efectivo de los activos depende de la fecha.
+
+    Las descargas de una misma clave se serializan con `lock(key)`, porque
+    comparten el archivo parcial `payload_<clave>.json.gz.part`.
+    """
+
+    def __init__(self, root, ttl_seconds):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def lock(self, key) -> threading.Lock:
+        """Lock de la clave; quien descarga el payload de `key` debe tenerlo tomado."""
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def key(url, method, day) -> str:
+        return hashlib.sha1(f"{url}|{method}|{day}".encode()).hexdigest()[:16]
+
+    def _path(self, name) -> str:
+        return os.path.join(self.root, name)
+
+    def get_payload(self, key, ignore_ttl=False):
+        """Metadatos del payload en cache si existe y no ha expirado (o aunque haya expirado, con ignore_ttl)."""
+        meta_path = self._path(f"payload_{key}.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if not os.path.exists(meta["path"]):
+            return None
+        if not ignore_ttl and time.time() - meta["created_at"] > self.ttl_seconds:
+            return None
+        return meta
+
+    def partial_path(self, key) -> str:
+        """Ruta donde se va escribiendo (gzip) la descarga en curso del payload."""
+        return self._path(f"payload_{key}.json.gz.part")
+
+    def commit_partial(self, key, encoding="utf-8", validators=None):
+        """
+        Registra como payload en cache la descarga completa en `partial_path`.
+
+        Recorre el archivo una vez para calcular el hash sha256 y los bytes
+        del contenido descomprimido (la descarga puede venir en varios
+        tramos) y guarda los validadores HTTP para pedidos condicionales.
+        """
+        partial = self.partial_path(key)
+        digest = hashlib.sha256()
+        n_bytes = 0
+        for chunk in self.iter_payload({"path": partial}, 1024 * 1024):
+            digest.update(chunk)
+            n_bytes += len(chunk)
+        path = self._path(f"payload_{key}.json.gz")
+        os.replace(partial, path)
+
+        meta = {
+            "path": path,
+            "sha256": digest.hexdigest(),
+            "bytes": n_bytes,
+            "encoding": encoding,
+            "validators": validators or {},
+            "created_at": time.time(),
+        }
+        with open(self._path(f"payload_{key}.json"), "w") as f:
+            json.dump(meta, f)
+        return meta
+
+    def touch_payload(self, key):
+        """Renueva la vigencia del payload en cache (la fuente respondió que no cambió)."""
+        meta = self.get_payload(key, ignore_ttl=True)
+        meta["created_at"] = time.time()
+        with open(self._path(f"payload_{key}.json"), "w") as f:
+            json.dump(meta, f)
+        return meta
+
+    def mark_latest(self, source, meta):
+        """Registra `meta` como el último payload completo de la fuente `source` (su URL)."""
+        name = hashlib.sha1(source.encode()).hexdigest()[:16]
+        with open(self._path(f"latest_{name}.json"), "w") as f:
+            json.dump(meta, f)
+
+    def latest_payload(self, source):
+        """
+        Último payload completo de la fuente, sin importar día ni vigencia.
+        Sirve de respaldo cuando la fuente falla en una carga de varias fuentes.
+        """
+        name = hashlib.sha1(source.encode()).hexdigest()[:16]
+        path = self._path(f"latest_{name}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            meta = json.load(f)
+        return meta if os.path.exists(meta["path"]) else None
+
+    @staticmethod
+    def iter_payload(meta, chunk_size):
+        """Lee el payload descomprimido por bloques."""
+        with gzip.open(meta["path"], "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def get_bridge(self, payload_hash, day):
+        path = self._path(f"bridge_{payload_hash[:16]}_{day}.parquet")
+        if not os.path.exists(path) or time.time() - os.path.getmtime(path) > self.ttl_seconds:
+            return None
+        return pd.read_parquet(path)
+
+    def put_bridge(self, payload_hash, day, df):
+        path = self._path(f"bridge_{payload_hash[:16]}_{day}.parquet")
+        # Temporal único: dos jobs pueden guardar el mismo bridge a la vez
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False, compression="zstd")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def last_loaded(self, target):
+        """Hash del payload y día de la última carga exitosa al destino."""
+        path = self._path("last_loaded.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f).get(target)
+
+    def mark_loaded(self, target, payload_hash, day, **extra):
+        """Registra la carga al destino; `extra` distingue cargas del mismo payload (por ejemplo, el modo de salida)."""
+        path = self._path("last_loaded.json")
+        loaded = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                loaded = json.load(f)
+        loaded[target] = {"sha256": payload_hash, "day": str(day), **extra}
+        with open(path, "w") as f:
+            json.dump(loaded, f)
+
+    def invalidate(self) -> int:
+        """
+        Elimina los payloads y bridges en cache y retorna la cantidad de archivos borrados.
+
+        Se conservan el registro de cargas (`last_loaded.json`), los temporales
+        de escrituras en curso y los archivos de las claves con una descarga en
+        curso (su lock está tomado). Solo se borran archivos regulares.
+        """
+        removed = 0
+        for name in os.listdir(self.root):
+            path = self._path(name)
+            if name == "last_loaded.json" or name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            lock = self.lock(name[len("payload_"):].split(".")[0]) if name.startswith("payload_") else None
+            if lock is not None and not lock.acquire(blocking=False):
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            finally:
+                if lock is not None:
+                    lock.release()
+        return removed
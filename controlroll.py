@@ -0,0 +1,182 @@
+import gzip
+import json
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+
+from metrics import log
+
+# Respuestas y errores que justifican reintentar la descarga
+RETRYABLE_STATUS = {500, 502, 503, 504}
+RETRYABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+)
+
+
+class ControlRollClient:
+    """
+    Cliente HTTP para el reporte de ControlRoll.
+
+    Mantiene una `Session` con pool de conexiones y negocia gzip/deflate. Usa
+    timeouts separados de conexión y de lectura (este último es el máximo
+    entre bytes, incluida la espera mientras ControlRoll genera el reporte) y
+    reintenta con backoff exponencial ante 5xx y errores de conexión.
+
+    El cuerpo se escribe descomprimido a un archivo `.part` (gzip) a medida
+    que llega. Si la respuesta trae ETag o Last-Modified, lo recibido se
+    conserva junto a un estado `.part.json` y los reintentos, incluidos los
+    de una ejecución posterior, piden solo el resto con `Range` + `If-Range`.
+    Si el servidor no acepta el rango, se descarta lo parcial y se parte de
+    cero.
+    """
+
+    def __init__(self, connect_timeout=10.0, read_timeout=3600.0, retries=3,
+                 backoff_seconds=2.0, chunk_size=1024 * 1024, pool_size=4):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+
+    @staticmethod
+    def _load_state(part_path):
+        """Estado de una descarga parcial reanudable, o None si no hay una válida."""
+        state_path = f"{part_path}.json"
+        if os.path.exists(state_path) and os.path.exists(part_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            # Si el proceso murió escribiendo, el archivo no coincide con el
+            # estado y lo recibido no es confiable
+            if os.path.getsize(part_path) == state["size"] and (state["etag"] or state["last_modified"]):
+                return state
+        ControlRollClient.discard(part_path)
+        return None
+
+    @staticmethod
+    def discard(part_path):
+        """Elimina la descarga parcial y su estado."""
+        for path in (part_path, f"{part_path}.json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def download(self, url, headers, part_path, validators=None) -> dict:
+        """
+        Descarga el reporte a `part_path` (gzip del cuerpo descomprimido).
+
+        `validators` ({"etag", "last_modified"}) son los de la copia en cache:
+        se envían como If-None-Match / If-Modified-Since y ante un 304 se
+        retorna {"status": "not_modified"} sin tocar la cache. Si no, retorna
+        {"status": "downloaded", "encoding", "etag", "last_modified", "bytes",
+        "resumed_bytes", "received_bytes", "attempts"} con el archivo completo
+        en `part_path`. `received_bytes` son los bytes recibidos en esta
+        llamada, sumando los intentos interrumpidos y sin contar los de una
+        ejecución anterior.
+        Agotados los reintentos relanza el último error; lo recibido queda
+        en disco si es reanudable.
+        """
+        state = self._load_state(part_path)
+        resumed_bytes = state["bytes"] if state else 0
+        received_bytes = 0
+        attempt = 0
+        while True:
+            attempt += 1
+            request_headers = dict(headers)
+            if state:
+                # El rango se pide sobre la representación sin comprimir, que
+                # es la que está en disco
+                request_headers.update({
+                    "Range": f"bytes={state['bytes']}-",
+                    "If-Range": state["etag"] or state["last_modified"],
+                    "Accept-Encoding": "identity",
+                })
+            elif validators:
+                if validators.get("etag"):
+                    request_headers["If-None-Match"] = validators["etag"]
+                if validators.get("last_modified"):
+                    request_headers["If-Modified-Since"] = validators["last_modified"]
+            try:
+                with self.session.get(url, headers=request_headers, timeout=self.timeout, stream=True) as response:
+                    log(f"Status code: {response.status_code}", status_code=response.status_code, attempt=attempt)
+                    if response.status_code == 304:
+                        return {"status": "not_modified", "attempts": attempt}
+                    if state and response.status_code == 416:
+                        self.discard(part_path)
+                        state = None
+                        raise requests.exceptions.ConnectionError("Rango no satisfacible, se reinicia la descarga")
+                    response.raise_for_status()
+                    content_range = response.headers.get("Content-Range", "")
+                    if state and response.status_code == 206 and content_range.startswith(f"bytes {state['bytes']}-"):
+                        log(f"⏯️ Reanudando descarga desde {state['bytes']} bytes", resumed_from=state["bytes"])
+                    else:
+                        self.discard(part_path)
+                        state = {
+                            "etag": response.headers.get("ETag"),
+                            "last_modified": response.headers.get("Last-Modified"),
+                            "encoding": response.encoding or "utf-8",
+                            "bytes": 0,
+                            "size": 0,
+                        }
+                    start = state["bytes"]
+                    try:
+                        self._receive(response, part_path, state)
+                    finally:
+                        received_bytes += state["bytes"] - start
+                if os.path.exists(f"{part_path}.json"):
+                    os.remove(f"{part_path}.json")
+                return {
+                    "status": "downloaded",
+                    "encoding": state["encoding"],
+                    "etag": state["etag"],
+                    "last_modified": state["last_modified"],
+                    "bytes": state["bytes"],
+                    "resumed_bytes": resumed_bytes,
+                    "received_bytes": received_bytes,
+                    "attempts": attempt,
+                }
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code not in RETRYABLE_STATUS or attempt > self.retries:
+                    raise
+                error = e
+            except RETRYABLE_ERRORS as e:
+                if attempt > self.retries:
+                    # requests reporta como ConnectionError un timeout de
+                    # lectura ocurrido mientras se recibe el cuerpo
+                    if isinstance(e.args[0] if e.args else None, ReadTimeoutError):
+                        raise requests.exceptions.ReadTimeout(*e.args, request=e.request, response=e.response) from e
+                    raise
+                error = e
+            state = self._load_state(part_path)
+            delay = self.backoff_seconds * 2 ** (attempt - 1)
+            log(f"⚠️ Descarga interrumpida ({type(error).__name__}), reintento {attempt}/{self.retries} en {delay:.0f}s",
+                severity="WARNING", attempt=attempt, retry_in_seconds=delay,
+                received_bytes=state["bytes"] if state else 0, error=str(error))
+            time.sleep(delay)
+
+    def _receive(self, response, part_path, state):
+        """
+        Agrega el cuerpo a `part_path` como un nuevo miembro gzip. El miembro
+        se cierra y el estado se guarda aunque la transferencia se corte, así
+        lo recibido se puede reanudar.
+        """
+        resumable = bool(state["etag"] or state["last_modified"])
+        try:
+            with gzip.open(part_path, "ab", compresslevel=5) as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        state["bytes"] += len(chunk)
+        finally:
+            state["size"] = os.path.getsize(part_path)
+            if resumable:
+                with open(f"{part_path}.json", "w") as f:
+                    json.dump(state, f)
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+_current = threading.local()
+logger = logging.getLogger("rotacion")
+
+
+def stage(name: str):
+    """
+    Marca el inicio de una etapa en el job que corre en este hilo.
+
+    Cierra la etapa anterior; fuera de un job no hace nada, por lo que el
+    pipeline puede llamarla siempre.
+    """
+    job = current()
+    if job is not None and not getattr(_current, "auxiliary", False):
+        job.start_stage(name)
+
+
+def current():
+    """Job que corre en este hilo (None fuera de un job)."""
+    return getattr(_current, "job", None)
+
+
+@contextmanager
+def attached(job):
+    """
+    Asocia un hilo auxiliar (por ejemplo, uno por fuente) al job que lo lanzó.
+
+    Los logs del hilo llevan el id del job, pero sus etapas no se marcan en
+    el job: las marca el hilo principal, para que no se intercalen.
+    """
+    previous = (current(), getattr(_current, "auxiliary", False))
+    if job is not previous[0]:
+        _current.job, _current.auxiliary = job, True
+    try:
+        yield
+    finally:
+        _current.job, _current.auxiliary = previous
+
+
+class JobConflict(Exception):
+    """Ya hay un job en curso para el mismo destino con otros parámetros."""
+
+    def __init__(self, job):
+        super().__init__(f"Job {job.id} en curso para {job.target} con otros parámetros")
+        self.job = job
+
+
+class Job:
+    """Ejecución en segundo plano de un proceso, con avance por etapas."""
+
+    def __init__(self, kind: str, target: str, params=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.target = target
+        self.params = params
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = []
+        self.result = None
+        self.error = None
+        self.joined = 0
+        self.done = threading.Event()
+
+    def start_stage(self, name: str):
+        now = time.time()
+        if self.stages and self.stages[-1]["finished_at"] is None:
+            self.stages[-1]["finished_at"] = now
+        self.stages.append({"name": name, "started_at": now, "finished_at": None})
+
+    def _finish(self, status: str):
+        now = time.time()
+        if self.stages and self.stages[-1]["finished_at"] is None:
+            self.stages[-1]["finished_at"] = now
+        self.finished_at = now
+        self.status = status
+        self.done.set()
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "target": self.target,
+            "params": self.params,
+            "status": self.status,
+            "joined_requests": self.joined,
+            "created_at": self.created_at,
+            "duration_seconds": round(end - self.started_at, 3) if self.started_at else None,
+            "current_stage": self.stages[-1]["name"] if self.status == "running" and self.stages else None,
+            "stages": [
+                {
+                    "name": s["name"],
+                    "duration_seconds": round((s["finished_at"] or end) - s["started_at"], 3),
+                    "finished": s["finished_at"] is not None,
+                }
+                for s in self.stages
+            ],
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Ejecuta los procesos largos en un pool de hilos con deduplicación single-flight.
+
+    Si llega un pedido para un destino que ya tiene un job en curso, se une a
+    ese job en vez de lanzar otro que compita por memoria y por la tabla. Solo
+    se une si los parámetros del pedido son los mismos; si no, JobConflict.
+    """
+
+    def __init__(self, max_workers: int, keep_finished: int = 50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def submit(self, kind: str, target: str, fn, *args, params=None, **kwargs):
+        """
+        Crea (o reutiliza) el job para `target`. Retorna (job, se_unió_a_uno_existente).
+        `params` identifica lo que hace el job; con un job en curso de otros
+        `params` para el mismo destino se lanza JobConflict.
+        """
+        with self.lock:
+            job = self.in_flight.get(target)
+            if job is not None:
+                if job.params != params:
+                    raise JobConflict(job)
+                job.joined += 1
+                return job, True
+            job = Job(kind, target, params)
+            self.jobs[job.id] = job
+            self.in_flight[target] = job
+            self._prune()
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job, False
+
+    def _run(self, job: Job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        _current.job = job
+        try:
+            job.result = fn(*args, **kwargs)
+            status = "succeeded"
+        except Exception as e:
+            detail = getattr(e, "detail", None)
+            job.error = detail if detail is not None else f"{type(e).__name__}: {str(e)}"
+            logger.error(f"❌ Job {job.id} ({job.kind}) falló: {job.error}", exc_info=True)
+            status = "failed"
+        finally:
+            _current.job = None
+            with self.lock:
+                if self.in_flight.get(job.target) is job:
+                    del self.in_flight[job.target]
+        job._finish(status)
+
+    def _prune(self):
+        finished = [j for j in self.jobs.values() if j.done.is_set()]
+        for job in sorted(finished, key=lambda j: j.created_at)[:-self.keep_finished or None]:
+            del self.jobs[job.id]
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
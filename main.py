@@ -1,261 +1,87 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
-import requests
-from google.cloud import bigquery
-import json
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import List, Optional
 from datetime import datetime
-import pandas as pd
 import os
-import numpy as np
+import threading
+import jobs
+import metrics
+from metrics import log
 
-# Configuración
+# Configuración (la del pipeline se lee en pipeline.py al importarlo)
 API_LOCAL_URL = os.getenv("API_LOCAL_URL")
 PROJECT_ID = os.getenv("PROJECT_ID")
 DATASET_ID = os.getenv("DATASET_ID")
 TABLE_ID = os.getenv("TABLE_ID")
-TOKEN = os.getenv("TOKEN_CR")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+WARM_PIPELINE = os.getenv("WARM_PIPELINE", "true").lower() == "true"
 
-def _robust_parse_date(s: pd.Series) -> pd.Series:
-    """Intenta parsear fechas en 'YYYY-MM-DD' o 'DD-MM-YYYY'."""
-    a = pd.to_datetime(s, errors="coerce", format="%Y-%m-%d")
-    b = pd.to_datetime(s, errors="coerce", dayfirst=True)
-    return a.fillna(b).dt.date
+JOBS = jobs.JobManager(max_workers=JOB_WORKERS)
 
-def normalize_and_filter(df: pd.DataFrame,
-                         exclude_codes=None,
-                         exclude_texts=None) -> pd.DataFrame:
-    """Normaliza fechas y aplica filtros de causales si corresponde."""
-    df = df.copy()
+# Módulo pipeline (pandas, pyarrow, BigQuery); se importa al primer uso o en el warm-up
+_PIPELINE = None
+_PIPELINE_LOCK = threading.Lock()
 
-    if "fecha_de_ingreso" not in df.columns:
-        raise ValueError("Falta columna fecha_de_ingreso")
-    if "fecha_finiquito" not in df.columns:
-        df["fecha_finiquito"] = np.nan
 
-    df["_f_ingreso"] = _robust_parse_date(df["fecha_de_ingreso"])
-    df["_f_finiquito"] = _robust_parse_date(df["fecha_finiquito"])
+def _pipeline():
+    """
+    Importa el pipeline la primera vez que se necesita y registra cuánto tomó.
 
-    today_local = datetime.today().date()
-    df["_f_fin_efectivo"] = df["_f_finiquito"].fillna(today_local)
+    `/` y `/health` no lo usan, así la instancia responde apenas arranca
+    FastAPI sin esperar al stack de datos.
+    """
+    global _PIPELINE
+    with _PIPELINE_LOCK:
+        if _PIPELINE is None:
+            t0 = time.perf_counter()
+            import pipeline
+            seconds = time.perf_counter() - t0
+            metrics.STARTUP_SECONDS.set(round(seconds, 3), phase="pipeline_import")
+            log(f"📦 Pipeline importado en {seconds:.2f}s", event="startup", phase="pipeline_import",
+                seconds=round(seconds, 3))
+            _PIPELINE = pipeline
+        return _PIPELINE
+
+
+def _warm_up():
+    """Importa el pipeline y crea el cliente BigQuery en segundo plano, tras levantar el servidor."""
+    try:
+        pipeline = _pipeline()
+        if pipeline.LOAD_SINK != "local":
+            t0 = time.perf_counter()
+            pipeline.bigquery_client()
+            metrics.STARTUP_SECONDS.set(round(time.perf_counter() - t0, 3), phase="bigquery_client")
+    except Exception as e:
+        # El warm-up es solo una optimización: el primer job lo reintenta
+        log(f"⚠️ Warm-up del pipeline falló: {type(e).__name__}: {str(e)}", severity="WARNING", exc_info=True)
 
-    return df
 
-def build_employee_month_bridge(df: pd.DataFrame) -> pd.DataFrame:
-    """Crea tabla empleado×mes con métricas de rotación."""
-    df = df.copy()
+def _pipeline_function(name):
+    """Función del pipeline para un job; el import ocurre en el hilo del job, no en el request."""
+    def run(*args, **kwargs):
+        return getattr(_pipeline(), name)(*args, **kwargs)
+    run.__name__ = run.__qualname__ = name
+    return run
 
-    min_month = pd.to_datetime(min(df["_f_ingreso"])).to_period("M").to_timestamp()
-    max_month = pd.to_datetime(max(df["_f_fin_efectivo"])).to_period("M").to_timestamp()
 
-    months = pd.DataFrame({
-        "month_start": pd.date_range(min_month, max_month, freq="MS")
-    })
-    months["month_end"] = (months["month_start"] + pd.offsets.MonthEnd(0)).dt.date
-    months["month_start"] = months["month_start"].dt.date
-    months["days_in_month"] = (
-        pd.to_datetime(months["month_end"]) - pd.to_datetime(months["month_start"])
-    ).dt.days + 1
-
-    df["_key"] = 1
-    months["_key"] = 1
-    x = df.merge(months, on="_key", how="outer")
-
-    start_ovl = pd.DataFrame({
-        "a": pd.to_datetime(x["_f_ingreso"]),
-        "b": pd.to_datetime(x["month_start"])
-    }).max(axis=1)
-    end_ovl = pd.DataFrame({
-        "a": pd.to_datetime(x["_f_fin_efectivo"]),
-        "b": pd.to_datetime(x["month_end"])
-    }).min(axis=1)
-
-    active_days = (end_ovl - start_ovl).dt.days + 1
-    x["active_days"] = active_days.clip(lower=0).fillna(0).astype(int)
-
-    x = x[x["active_days"] > 0].copy()
-
-    x["active_on_month_start"] = (
-        (pd.to_datetime(x["_f_ingreso"]) <= pd.to_datetime(x["month_start"])) &
-        (pd.to_datetime(x["_f_fin_efectivo"]) >= pd.to_datetime(x["month_start"]))
-    ).astype(int)
-
-    x["active_on_month_end"] = (
-        (pd.to_datetime(x["_f_ingreso"]) <= pd.to_datetime(x["month_end"])) &
-        (pd.to_datetime(x["_f_fin_efectivo"]) >= pd.to_datetime(x["month_end"]))
-    ).astype(int)
-
-    f_ing_m = pd.to_datetime(x["_f_ingreso"]).dt.to_period("M").dt.to_timestamp()
-    f_out_m = pd.to_datetime(x["_f_finiquito"]).dt.to_period("M").dt.to_timestamp()
-    month_start_ts = pd.to_datetime(x["month_start"]).dt.to_period("M").dt.to_timestamp()
-
-    x["hire_in_month"] = ((~pd.isna(x["_f_ingreso"])) & (f_ing_m == month_start_ts)).astype(int)
-    x["term_in_month"] = ((~pd.isna(x["_f_finiquito"])) & (f_out_m == month_start_ts)).astype(int)
-
-    if "cod_causal_finiquito" in x.columns:
-        x["term_causal_code"] = np.where(
-            x["term_in_month"].eq(1), x["cod_causal_finiquito"], pd.NA
-        )
-    else:
-        x["term_causal_code"] = pd.NA
+@asynccontextmanager
+async def lifespan(app):
+    log(f"🚀 Aplicación lista (import de main en {_IMPORT_SECONDS:.2f}s)",
+        event="startup", phase="app_import", seconds=_IMPORT_SECONDS, warm_pipeline=WARM_PIPELINE)
+    if WARM_PIPELINE:
+        threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    yield
+    if _PIPELINE is not None:
+        _PIPELINE.close_clients()
 
-    if "causal_finiquito" in x.columns:
-        x["term_causal_text"] = np.where(
-            x["term_in_month"].eq(1), x["causal_finiquito"], pd.NA
-        )
-    else:
-        x["term_causal_text"] = pd.NA
-
-    x["active_ratio"] = x["active_days"] / x["days_in_month"]
-    x["period"] = pd.to_datetime(x["month_start"]).dt.strftime("%Y-%m")
-
-    cols_dims = [c for c in [
-        "rut", "nombre_completo", "cliente", "cecos", "cecosorigen",
-        "cargo","tipo_empleado", "estado", "instalacion","_f_ingreso","_f_finiquito","_f_fin_efectivo"
-    ] if c in x.columns]
-    cols_dates = ["month_start", "month_end", "period"]
-    cols_metrics = [
-        "days_in_month", "active_days", "active_ratio",
-        "active_on_month_start", "active_on_month_end",
-        "hire_in_month", "term_in_month", "term_causal_code", "term_causal_text"
-    ]
-
-    return x[cols_dims + cols_dates + cols_metrics].copy()
-
-def fetch_and_process_data():
-    """Función para obtener y procesar datos de la API externa"""
-    print("=== OBTENIENDO Y PROCESANDO DATOS ===")
-    
-    # Preparar parámetros para la API local
-    headers = {
-        "method": "report",
-        "token": TOKEN
-    }
-    print(f"API URL: {API_LOCAL_URL}")
-    print(f"Headers: {headers}")
-    
-    try:
-        print("🔄 Iniciando llamada a ControlRoll...")
-        response = requests.get(API_LOCAL_URL, headers=headers, timeout=3600)
-        print("✅ Llamada completada")
-    except requests.exceptions.Timeout:
-        error_msg = "Timeout: La API externa tardó más de 1 hora en responder"
-        print(f"❌ {error_msg}")
-        raise HTTPException(status_code=504, detail=error_msg)
-    except requests.exceptions.ConnectionError as e:
-        error_msg = f"Error de conexión con la API externa: {str(e)}"
-        print(f"❌ {error_msg}")
-        raise HTTPException(status_code=502, detail=error_msg)
-    except requests.exceptions.RequestException as e:
-        error_msg = f"Error en la petición HTTP: {str(e)}"
-        print(f"❌ {error_msg}")
-        raise HTTPException(status_code=502, detail=error_msg)
-    except Exception as e:
-        error_msg = f"Error inesperado: {type(e).__name__}: {str(e)}"
-        print(f"❌ {error_msg}")
-        import traceback
-        print(f"❌ Stack trace: {traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=error_msg)
-    
-    print(f"Status code: {response.status_code}")
-    response.raise_for_status()
-    data_text = response.text
-    print(f"Longitud de respuesta: {len(data_text)}")
-    print(f"Primeros 200 caracteres: {data_text[:200]}")
-    
-    data_json = json.loads(data_text)
-    print(f"Datos obtenidos: {len(data_json)} registros")
-    print(f"Primer registro: {data_json[0] if data_json else 'No hay datos'}")
-    
-    if not data_json:
-        print("No hay datos para procesar")
-        return None
-
-    # Convertir a DataFrame
-    data = pd.DataFrame(data_json)
-    date_columns = ['FECHA DE INGRESO', 'FECHA_FINIQUITO']
-    for col in date_columns:
-        if col in data.columns:
-            data[col] = pd.to_datetime(data[col], format='%d-%m-%Y')
-    
-    # Normalizar nombres de columnas
-    data.columns = data.columns.str.lower()
-    data.columns = data.columns.str.replace(' ', '_')
-    data.columns = data.columns.str.replace('.', '')
-    data.columns = data.columns.str.replace('%', '')
-    data.columns = data.columns.str.replace('-', '_')
-    data.columns = data.columns.str.replace('(', '')
-    data.columns = data.columns.str.replace(')', '')
-    data.columns = data.columns.str.replace('á', 'a')
-    data.columns = data.columns.str.replace('é', 'e')
-    data.columns = data.columns.str.replace('í', 'i')
-    data.columns = data.columns.str.replace('ó', 'o')
-    data.columns = data.columns.str.replace('ú', 'u')
-    data.columns = data.columns.str.replace('ñ', 'n')
-    data.columns = data.columns.str.replace('°', '')
-    
-    # Procesar datos de rotación
-    df_norm = normalize_and_filter(data, exclude_codes=[9999], exclude_texts=["Inactivar sin Movimiento"])
-    df_norm = df_norm.loc[(df_norm.tipo_empleado!='PART TIME BOLETA')]
-    df_bridge = build_employee_month_bridge(df_norm)
-    df_bridge = df_bridge[['period','rut', 'cliente', 'instalacion', 'cecos', 'cargo', 'nombre_completo', 'tipo_empleado',
-           'estado', '_f_ingreso', '_f_finiquito', 'month_start', 'month_end', 
-           'days_in_month', 'active_days', 'active_ratio', 'active_on_month_start',
-           'active_on_month_end', 'hire_in_month', 'term_in_month', 'term_causal_text']]
-
-    print(f"✅ Datos procesados exitosamente: {len(df_bridge)} registros")
-    return df_bridge
-
-def load_to_bigquery(df_bridge):
-    """Función para cargar datos procesados a BigQuery"""
-    if df_bridge is None:
-        return {
-            "success": True,
-            "message": "No hay datos para cargar",
-            "records_processed": 0
-        }
-    
-    print("=== CARGANDO DATOS A BIGQUERY ===")
-    
-    try:
-        client = bigquery.Client(project=PROJECT_ID)
-        table_id = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}"
-        
-        job_config = bigquery.LoadJobConfig(
-            write_disposition="WRITE_TRUNCATE"
-        )
-        
-        print(f"🔄 Cargando {len(df_bridge)} registros a BigQuery: {table_id}")
-        job = client.load_table_from_dataframe(df_bridge, table_id, job_config=job_config)
-        job.result()
-        
-        print(f"✅ Data cargada exitosamente. {len(df_bridge)} registros cargados a BigQuery.")
-        
-        return {
-            "success": True,
-            "message": "Data procesada y cargada exitosamente",
-            "records_processed": len(df_bridge)
-        }
-    except Exception as e:
-        error_msg = f"Error al cargar datos en BigQuery: {type(e).__name__}: {str(e)}"
-        print(f"❌ {error_msg}")
-        import traceback
-        print(f"❌ Stack trace: {traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=error_msg)
-
-def sync_to_bigquery():
-    """Función principal para sincronizar datos con BigQuery"""
-    print("=== INICIANDO SINCRONIZACIÓN COMPLETA ===")
-    
-    # Paso 1: Obtener y procesar datos
-    df_bridge = fetch_and_process_data()
-    
-    # Paso 2: Cargar a BigQuery
-    result = load_to_bigquery(df_bridge)
-    
-    return result
 
 # Crear la aplicación FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 def root():
@@ -270,72 +96,241 @@ def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
-@app.post("/fetch_data")
-def fetch_data():
+def _destination_key() -> str:
+    return f"load:{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}"
+
+def _with_profile(fn, profile):
+    """Valida el modo de perfilado pedido y envuelve la función del job"""
+    if profile is not None and profile not in metrics.PROFILE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"profile debe ser uno de {list(metrics.PROFILE_MODES)}"
+        )
+    return metrics.profiled(fn, profile)
+
+def _sync_filters(exclude_codes, exclude_texts, exclude_tipos, tipos, period_from, period_to):
     """
-    Endpoint para obtener y procesar datos de la API externa (sin cargar a BigQuery)
+    Filtros de empleados pedidos a los endpoints de proceso (ver DEFAULT_FILTERS
+    en pipeline.py); los parámetros omitidos toman el valor por defecto.
+    Las listas se ordenan para que el mismo pedido compare igual entre jobs.
     """
+    for name, value in (("period_from", period_from), ("period_to", period_to)):
+        if value is None:
+            continue
+        try:
+            datetime.strptime(value, "%Y-%m")
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"{name} debe tener formato YYYY-MM: {value}")
+    if period_from is not None and period_to is not None and period_from > period_to:
+        raise HTTPException(status_code=400, detail="period_from no puede ser posterior a period_to")
+    filters = {
+        "exclude_codes": exclude_codes and sorted(set(exclude_codes)),
+        "exclude_texts": exclude_texts and sorted(set(exclude_texts)),
+        "exclude_tipos": exclude_tipos and sorted(set(exclude_tipos)),
+        "tipos": tipos and sorted(set(tipos)),
+        "period_from": period_from, "period_to": period_to,
+    }
+    return {k: v for k, v in filters.items() if v is not None} or None
+
+def _submit(kind, target, fn, *args, params=None):
+    """Crea o se une al job del destino; con un job en curso de otros parámetros responde 409"""
     try:
-        df_bridge = fetch_and_process_data()
-        if df_bridge is None:
-            return {
-                "success": True,
-                "message": "No hay datos para procesar",
-                "records_processed": 0
-            }
-        
-        return {
-            "success": True,
-            "message": "Datos obtenidos y procesados exitosamente",
-            "records_processed": len(df_bridge),
-            "columns": list(df_bridge.columns),
-            "sample_data": df_bridge.head(3).to_dict('records') if len(df_bridge) > 0 else []
-        }
-    except Exception as e:
-        error_response = {
+        return JOBS.submit(kind, target, fn, *args, params=params)
+    except jobs.JobConflict as e:
+        raise HTTPException(status_code=409, detail={
             "success": False,
-            "error": str(e),
-            "message": "Error al obtener y procesar datos"
-        }
-        raise HTTPException(status_code=500, detail=error_response)
+            "message": "Hay otro proceso en curso para el mismo destino con otros parámetros",
+            "job_id": e.job.id,
+            "params": e.job.params
+        })
+
+def _job_response(job, joined, wait, error_message):
+    """Respuesta de los endpoints de proceso: el job creado/unido, o su resultado si wait=true"""
+    if wait:
+        job.done.wait()
+        if job.status == "failed":
+            raise HTTPException(status_code=500, detail={
+                "success": False,
+                "error": str(job.error),
+                "message": error_message,
+                "job_id": job.id
+            })
+        return job.result
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "message": "Proceso en curso (job existente)" if joined else "Proceso iniciado",
+        "job_id": job.id,
+        "status": job.status,
+        "joined": joined
+    })
+
+@app.post("/fetch_data")
+def fetch_data(force_refresh: bool = False, wait: bool = False, profile: Optional[str] = None,
+               exclude_codes: Optional[List[str]] = Query(None),
+               exclude_texts: Optional[List[str]] = Query(None), exclude_tipos: Optional[List[str]] = Query(None),
+               tipos: Optional[List[str]] = Query(None),
+               period_from: Optional[str] = None, period_to: Optional[str] = None):
+    """
+    Endpoint para obtener y procesar datos de la API externa (sin cargar a BigQuery).
+    Reutiliza el payload y el bridge en cache salvo que se pida force_refresh=true.
+    Retorna el id del job; con wait=true espera y retorna el resultado.
+    Con profile=cpu|memory el resultado incluye el perfil de la ejecución.
+    exclude_codes, exclude_texts, exclude_tipos y tipos (repitiendo el parámetro)
+    reemplazan los filtros de empleados por defecto; period_from/period_to
+    ('YYYY-MM') limitan los meses generados.
+    """
+    filters = _sync_filters(exclude_codes, exclude_texts, exclude_tipos, tipos, period_from, period_to)
+    fn = _with_profile(_pipeline_function("fetch_data_summary"), profile)
+    # Pedidos con filtros distintos no comparten job
+    target = f"fetch:{API_LOCAL_URL}" + (f":{sorted(filters.items())}" if filters else "")
+    job, joined = _submit("fetch_data", target, fn, force_refresh, filters)
+    return _job_response(job, joined, wait, "Error al obtener y procesar datos")
 
 @app.post("/load_data")
-def load_data():
+def load_data(force_refresh: bool = False, wait: bool = False, profile: Optional[str] = None,
+              exclude_codes: Optional[List[str]] = Query(None),
+              exclude_texts: Optional[List[str]] = Query(None), exclude_tipos: Optional[List[str]] = Query(None),
+              tipos: Optional[List[str]] = Query(None),
+              period_from: Optional[str] = None, period_to: Optional[str] = None):
     """
-    Endpoint para cargar datos procesados a BigQuery
+    Endpoint para cargar datos procesados a BigQuery.
+    Si el payload del día ya se cargó, se omite la carga salvo force_refresh=true.
+    Un pedido mientras hay otra carga en curso al mismo destino se une a ese job
+    (409 si esa carga es incremental o usa otros filtros).
+    Con profile=cpu|memory el resultado incluye el perfil de la ejecución.
+    Los filtros son los de /fetch_data; con period_from/period_to solo se
+    reemplazan las particiones de esa ventana.
     """
-    try:
-        # Primero obtener los datos
-        df_bridge = fetch_and_process_data()
-        
-        # Luego cargarlos a BigQuery
-        result = load_to_bigquery(df_bridge)
-        return result
-    except Exception as e:
-        error_response = {
-            "success": False,
-            "error": str(e),
-            "message": "Error al cargar datos a BigQuery"
-        }
-        raise HTTPException(status_code=500, detail=error_response)
+    filters = _sync_filters(exclude_codes, exclude_texts, exclude_tipos, tipos, period_from, period_to)
+    fn = _with_profile(_pipeline_function("sync_to_bigquery"), profile)
+    job, joined = _submit("load_data", _destination_key(), fn, force_refresh, filters,
+                          params={"mode": "full", "filters": filters})
+    return _job_response(job, joined, wait, "Error al cargar datos a BigQuery")
 
 @app.post("/rotacion_sync")
-def rotacion_sync():
+def rotacion_sync(incremental: bool = False, force_refresh: bool = False, wait: bool = False,
+                  profile: Optional[str] = None, exclude_codes: Optional[List[str]] = Query(None),
+                  exclude_texts: Optional[List[str]] = Query(None), exclude_tipos: Optional[List[str]] = Query(None),
+                  tipos: Optional[List[str]] = Query(None),
+                  period_from: Optional[str] = None, period_to: Optional[str] = None):
     """
-    Endpoint para sincronizar datos de rotación (proceso completo)
+    Endpoint para sincronizar datos de rotación (proceso completo).
+    Con incremental=true solo se aplican los cambios desde el último snapshot;
+    con force_refresh=true se ignora la cache y se vuelve a llamar a ControlRoll.
+    Un pedido mientras hay otra carga en curso al mismo destino se une a ese job
+    si es del mismo modo (completo o incremental) y filtros; si no, responde 409.
+    Con profile=cpu|memory el resultado incluye el perfil de la ejecución.
+    Los filtros son los de /load_data (con filtros no se hace carga incremental).
     """
-    try:
-        result = sync_to_bigquery()
-        return result
-    except Exception as e:
-        error_response = {
-            "success": False,
-            "error": str(e),
-            "message": "Error al procesar la sincronización"
-        }
-        raise HTTPException(status_code=500, detail=error_response)
+    filters = _sync_filters(exclude_codes, exclude_texts, exclude_tipos, tipos, period_from, period_to)
+    name = "sync_incremental_to_bigquery" if incremental else "sync_to_bigquery"
+    fn = _with_profile(_pipeline_function(name), profile)
+    job, joined = _submit("rotacion_sync", _destination_key(), fn, force_refresh, filters,
+                          params={"mode": "incremental" if incremental else "full", "filters": filters})
+    return _job_response(job, joined, wait, "Error al procesar la sincronización")
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Endpoint para consultar el estado, las etapas y el resultado de un job
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job no encontrado: {job_id}")
+    return job.to_dict()
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Endpoint con las métricas por etapa en formato Prometheus
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _current_index():
+    # Sin pipeline importado no puede haber un índice publicado; no se importa solo para responder 503
+    index = _PIPELINE.BRIDGE_INDEX if _PIPELINE is not None else None
+    if index is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Índice no disponible: aún no termina una sincronización completa en esta instancia"
+        )
+    return index
+
+def _query_filters(tenant, cliente, instalacion, cecos, rut) -> dict:
+    return {"tenant": tenant, "cliente": cliente, "instalacion": instalacion, "cecos": cecos, "rut": rut}
+
+@app.get("/query/status")
+def query_status():
+    """
+    Endpoint con el origen y el uso de memoria del índice en memoria del bridge
+    """
+    index = _current_index()
+    return {
+        "built_at": datetime.fromtimestamp(index.built_at).isoformat(),
+        "source": index.source,
+        "memory": index.memory_report(),
+    }
+
+@app.get("/query/rows")
+def query_rows(period_from: Optional[str] = None, period_to: Optional[str] = None,
+               tenant: Optional[List[str]] = Query(None),
+               cliente: Optional[List[str]] = Query(None), instalacion: Optional[List[str]] = Query(None),
+               cecos: Optional[List[str]] = Query(None), rut: Optional[List[str]] = Query(None),
+               limit: int = Query(100, ge=1, le=10000), offset: int = Query(0, ge=0)):
+    """
+    Endpoint para consultar filas del último bridge sincronizado.
+    Los filtros por dimensión aceptan varios valores (se repite el parámetro)
+    y el rango de períodos 'YYYY-MM' es inclusivo.
+    """
+    index = _current_index()
+    positions = index.select(_query_filters(tenant, cliente, instalacion, cecos, rut), period_from, period_to)
+    page = _PIPELINE._dates_for_load(index.frame(positions[offset:offset + limit]))
+    return {
+        "total": len(positions),
+        "limit": limit,
+        "offset": offset,
+        "rows": page.astype(object).where(page.notna(), None).to_dict("records"),
+    }
+
+@app.get("/query/aggregate")
+def query_aggregate(group_by: List[str] = Query(["period"]),
+                    period_from: Optional[str] = None, period_to: Optional[str] = None,
+                    tenant: Optional[List[str]] = Query(None),
+                    cliente: Optional[List[str]] = Query(None), instalacion: Optional[List[str]] = Query(None),
+                    cecos: Optional[List[str]] = Query(None), rut: Optional[List[str]] = Query(None)):
+    """
+    Endpoint con los KPI de rotación (dotación, ingresos, finiquitos, FTE y
+    tasa de rotación) de las filas filtradas, agrupados por `group_by`.
+    """
+    index = _current_index()
+    invalid = [col for col in group_by if col not in index.categories]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"group_by no válido: {invalid}; columnas disponibles: {sorted(index.categories)}"
+        )
+    positions = index.select(_query_filters(tenant, cliente, instalacion, cecos, rut), period_from, period_to)
+    result = index.aggregate(positions, group_by)
+    return {
+        "rows_scanned": len(positions),
+        "groups": _PIPELINE._dates_for_load(result).astype(object).where(result.notna(), None).to_dict("records"),
+    }
+
+@app.delete("/cache")
+def invalidate_cache():
+    """
+    Endpoint para invalidar la cache de payloads y bridges
+    """
+    removed = _pipeline().CACHE.invalidate()
+    return {
+        "success": True,
+        "message": "Cache invalidada",
+        "files_removed": removed
+    }
+
+_IMPORT_SECONDS = round(time.perf_counter() - _IMPORT_STARTED, 3)
+metrics.STARTUP_SECONDS.set(_IMPORT_SECONDS, phase="app_import")
 
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
-
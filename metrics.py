@@ -0,0 +1,272 @@
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import jobs
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "30"))
+
+logger = logging.getLogger("rotacion")
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Una línea JSON por evento, con los campos que Cloud Logging reconoce
+    (`severity`, `message`) más los campos estructurados del evento y el job
+    en curso.
+    """
+
+    def format(self, record):
+        entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+        }
+        job = jobs.current()
+        if job is not None:
+            entry["job_id"] = job.id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["stack_trace"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def log(message: str, severity: str = "INFO", exc_info=False, **fields):
+    """Registra un evento estructurado; `fields` se agregan como campos del JSON."""
+    logger.log(logging.getLevelName(severity), message, exc_info=exc_info, extra={"fields": fields})
+
+
+class _Metric:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        return [(self.name + self._labels(k), v) for k, v in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=()):
+        super().__init__(name, help_text, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total, n = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= b) for c, b in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, n + 1)
+
+    def samples(self):
+        out = []
+        for key, (counts, total, n) in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, counts):
+                out.append((f"{self.name}_bucket{self._labels(key, [('le', bound)])}", count))
+            out.append((f"{self.name}_bucket{self._labels(key, [('le', '+Inf')])}", n))
+            out.append((f"{self.name}_sum{self._labels(key)}", total))
+            out.append((f"{self.name}_count{self._labels(key)}", n))
+        return out
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+STAGE_SECONDS = _register(Histogram(
+    "rotacion_stage_duration_seconds", "Tiempo de reloj por etapa del pipeline", ["stage"],
+    buckets=[0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600],
+))
+STAGE_CPU = _register(Counter(
+    "rotacion_stage_cpu_seconds_total", "Tiempo de CPU del proceso por etapa", ["stage"]))
+STAGE_RUNS = _register(Counter(
+    "rotacion_stage_runs_total", "Ejecuciones por etapa y resultado", ["stage", "status"]))
+STAGE_ROWS_IN = _register(Counter(
+    "rotacion_stage_rows_in_total", "Filas de entrada por etapa", ["stage"]))
+STAGE_ROWS_OUT = _register(Counter(
+    "rotacion_stage_rows_out_total", "Filas de salida por etapa", ["stage"]))
+STAGE_BYTES = _register(Counter(
+    "rotacion_stage_bytes_total", "Bytes descargados o subidos por etapa", ["stage"]))
+STAGE_RSS_DELTA = _register(Gauge(
+    "rotacion_stage_peak_rss_delta_bytes", "Aumento del pico de memoria residente en la última ejecución de la etapa", ["stage"]))
+PEAK_RSS = _register(Gauge(
+    "rotacion_process_peak_rss_bytes", "Pico de memoria residente del proceso"))
+STARTUP_SECONDS = _register(Gauge(
+    "rotacion_startup_seconds", "Tiempo de cada fase del arranque (app_import, pipeline_import, bigquery_client)", ["phase"]))
+
+
+def render() -> str:
+    """Todas las métricas en el formato de texto de Prometheus."""
+    PEAK_RSS.set(_peak_rss_bytes())
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        with metric.lock:
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss viene en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+_stages = threading.local()
+
+
+def record(**counts):
+    """
+    Agrega contadores (`rows_in`, `rows_out`, `bytes`) a la etapa en curso
+    de este hilo; fuera de una etapa no hace nada.
+    """
+    stack = getattr(_stages, "stack", None)
+    if stack:
+        stack[-1].update(counts)
+
+
+def timed(name: str):
+    """
+    Decorador que instrumenta una etapa del pipeline.
+
+    Marca la etapa en el job en curso y al terminar registra tiempo de reloj,
+    tiempo de CPU del proceso, aumento del pico de RSS y los contadores
+    entregados con `record`, como log estructurado y en las métricas.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            jobs.stage(name)
+            counts = {}
+            _stages.stack = getattr(_stages, "stack", []) + [counts]
+            rss0 = _peak_rss_bytes()
+            cpu0 = time.process_time()
+            t0 = time.perf_counter()
+            status = "error"
+            try:
+                result = fn(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                _stages.stack = _stages.stack[:-1]
+                wall = time.perf_counter() - t0
+                cpu = time.process_time() - cpu0
+                rss_delta = _peak_rss_bytes() - rss0
+                STAGE_SECONDS.observe(wall, stage=name)
+                STAGE_CPU.inc(cpu, stage=name)
+                STAGE_RUNS.inc(stage=name, status=status)
+                STAGE_RSS_DELTA.set(rss_delta, stage=name)
+                for key, metric in (("rows_in", STAGE_ROWS_IN), ("rows_out", STAGE_ROWS_OUT), ("bytes", STAGE_BYTES)):
+                    if key in counts:
+                        metric.inc(counts[key], stage=name)
+                log(
+                    f"⏱️ Etapa {name}: {wall:.2f}s", severity="INFO" if status == "ok" else "ERROR",
+                    event="stage", stage=name, status=status, wall_seconds=round(wall, 3),
+                    cpu_seconds=round(cpu, 3), peak_rss_delta_bytes=rss_delta, **counts,
+                )
+        return wrapper
+    return decorator
+
+
+PROFILE_MODES = ("cpu", "memory")
+
+
+def profiled(fn, mode):
+    """
+    Envuelve `fn` para perfilarla con cProfile (`cpu`) o tracemalloc (`memory`).
+
+    El resumen se agrega al resultado bajo la clave `profile`. cProfile solo
+    observa el hilo del job; tracemalloc observa todo el proceso y hace más
+    lenta la ejecución mientras está activo.
+    """
+    if mode is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if mode == "cpu":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            report = {"mode": mode, "top": [line for line in stream.getvalue().splitlines() if line.strip()]}
+        else:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            try:
+                result = fn(*args, **kwargs)
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                if started:
+                    tracemalloc.stop()
+            report = {
+                "mode": mode,
+                "peak_traced_bytes": peak,
+                "top": [
+                    {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:PROFILE_TOP]
+                ],
+            }
+        if isinstance(result, dict):
+            result = {**result, "profile": report}
+        return result
+    return wrapper
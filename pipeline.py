@@ -0,0 +1,1860 @@
+"""
+Pipeline de rotación: descarga del reporte de ControlRoll, normalización,
+bridge empleado×mes, carga a BigQuery, rollups de KPI e índice en memoria.
+
+Importa el stack de datos (pandas, numpy, pyarrow, BigQuery), por lo que
+main.py lo carga recién cuando se necesita o en segundo plano al arrancar.
+"""
+from fastapi import HTTPException
+import requests
+from google.cloud import bigquery
+import json
+import codecs
+import hashlib
+from datetime import datetime, date
+import pandas as pd
+import os
+import time
+import threading
+import queue
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sinks import BigQuerySink, LocalSink, partition_ids
+from cache import PayloadCache
+from controlroll import ControlRollClient
+from bridge_index import BridgeIndex, kpi_aggregate
+import jobs
+import metrics
+from metrics import log
+
+# Configuración
+API_LOCAL_URL = os.getenv("API_LOCAL_URL")
+PROJECT_ID = os.getenv("PROJECT_ID")
+DATASET_ID = os.getenv("DATASET_ID")
+TABLE_ID = os.getenv("TABLE_ID")
+TOKEN = os.getenv("TOKEN_CR")
+TENANT = os.getenv("TENANT", "default")
+CONTROLROLL_SOURCES = os.getenv("CONTROLROLL_SOURCES")
+SOURCE_CONCURRENCY = int(os.getenv("SOURCE_CONCURRENCY", "4"))
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", str(1024 * 1024)))
+CONTROLROLL_CONNECT_TIMEOUT = float(os.getenv("CONTROLROLL_CONNECT_TIMEOUT", "10"))
+CONTROLROLL_READ_TIMEOUT = float(os.getenv("CONTROLROLL_READ_TIMEOUT", "3600"))
+CONTROLROLL_RETRIES = int(os.getenv("CONTROLROLL_RETRIES", "3"))
+CONTROLROLL_BACKOFF_SECONDS = float(os.getenv("CONTROLROLL_BACKOFF_SECONDS", "2"))
+LOAD_SINK = os.getenv("LOAD_SINK", "bigquery")
+LOCAL_SINK_DIR = os.getenv("LOCAL_SINK_DIR", "/tmp/carga_rotacion/sink")
+LOAD_ARTIFACT_DIR = os.getenv("LOAD_ARTIFACT_DIR")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "/tmp/carga_rotacion/employees_snapshot.parquet")
+CACHE_DIR = os.getenv("CACHE_DIR", "/tmp/carga_rotacion/cache")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(6 * 3600)))
+BRIDGE_WORKERS = int(os.getenv("BRIDGE_WORKERS", "1"))
+BRIDGE_SHARD_SIZE = int(os.getenv("BRIDGE_SHARD_SIZE", "20000"))
+BRIDGE_EXECUTOR = os.getenv("BRIDGE_EXECUTOR", "process")
+KPI_ROLLUPS = os.getenv("KPI_ROLLUPS", "true").lower() == "true"
+QUERY_INDEX = os.getenv("QUERY_INDEX", "true").lower() == "true"
+OUTPUT_MODE = os.getenv("OUTPUT_MODE", "bridge")
+LOAD_PIPELINE = os.getenv("LOAD_PIPELINE", "false").lower() == "true"
+LOAD_CHUNK_MONTHS = int(os.getenv("LOAD_CHUNK_MONTHS", "12"))
+LOAD_QUEUE_DEPTH = int(os.getenv("LOAD_QUEUE_DEPTH", "2"))
+
+CACHE = PayloadCache(CACHE_DIR, CACHE_TTL_SECONDS)
+CONTROLROLL = ControlRollClient(
+    connect_timeout=CONTROLROLL_CONNECT_TIMEOUT,
+    read_timeout=CONTROLROLL_READ_TIMEOUT,
+    retries=CONTROLROLL_RETRIES,
+    backoff_seconds=CONTROLROLL_BACKOFF_SECONDS,
+    chunk_size=INGEST_CHUNK_SIZE,
+    pool_size=SOURCE_CONCURRENCY,
+)
+
+# Cliente BigQuery compartido por todas las cargas de la instancia (se crea al primer uso)
+_BIGQUERY_CLIENT = None
+_BIGQUERY_CLIENT_LOCK = threading.Lock()
+
+# Índice en memoria del último bridge; se reemplaza completo al terminar cada sincronización
+BRIDGE_INDEX = None
+
+# Contrato con el reporte de ControlRoll: columna destino -> (encabezado original, tipo, requerida).
+# Un encabezado calza si coincide con el original una vez normalizados ambos (ver _normalize_header);
+# el resto de las columnas del reporte se descarta al leer. Tipos: "category" (dimensión
+# categórica), "date" (texto de fecha, se parsea en normalize_and_filter) y "value" (tipo
+# inferido por pandas).
+SOURCE_SCHEMA = {
+    "rut": ("RUT", "category", True),
+    "nombre_completo": ("NOMBRE COMPLETO", "category", True),
+    "cliente": ("CLIENTE", "category", True),
+    "cecos": ("CECOS", "category", True),
+    "cecosorigen": ("CECOSORIGEN", "category", False),
+    "cargo": ("CARGO", "category", True),
+    "tipo_empleado": ("TIPO EMPLEADO", "category", True),
+    "estado": ("ESTADO", "category", True),
+    "instalacion": ("INSTALACIÓN", "category", True),
+    "fecha_de_ingreso": ("FECHA DE INGRESO", "date", True),
+    "fecha_finiquito": ("FECHA_FINIQUITO", "date", False),
+    "cod_causal_finiquito": ("COD. CAUSAL FINIQUITO", "value", False),
+    "causal_finiquito": ("CAUSAL FINIQUITO", "category", False),
+}
+
+# Columnas (ya normalizadas) que usa el pipeline
+INGEST_COLUMNS = set(SOURCE_SCHEMA)
+
+# Dimensiones que se mantienen como categóricas desde la ingesta hasta la carga
+CATEGORICAL_COLUMNS = {col for col, (_, kind, _) in SOURCE_SCHEMA.items() if kind == "category"}
+
+# Columnas de empleado que se replican por mes en el bridge (el resto no entra a la expansión)
+BRIDGE_SOURCE_COLUMNS = [
+    "tenant", "rut", "nombre_completo", "cliente", "cecos", "cecosorigen", "cargo", "tipo_empleado",
+    "estado", "instalacion", "_f_ingreso", "_f_finiquito", "_f_fin_efectivo",
+    "cod_causal_finiquito", "causal_finiquito",
+]
+
+# Filtros de empleados por defecto: causales de finiquito que no son rotación real y
+# tipos de empleado que no entran al bridge. period_from/period_to ('YYYY-MM')
+# restringen los meses generados; sin ellos el bridge va del primer ingreso a hoy.
+DEFAULT_FILTERS = {
+    "exclude_codes": ["9999"],
+    "exclude_texts": ["Inactivar sin Movimiento"],
+    "exclude_tipos": ["PART TIME BOLETA"],
+    "tipos": None,
+    "period_from": None,
+    "period_to": None,
+}
+
+# Columnas de fecha que internamente viajan como datetime64 (date32 en la carga, date en la salida JSON)
+DATE_COLUMNS = ["_f_ingreso", "_f_finiquito", "_f_fin_efectivo", "month_start", "month_end"]
+
+# Formatos fijos de fecha: nombre -> (patrón, formato strptime)
+DATE_FORMATS = {
+    "iso": (r"\d{4}-\d{2}-\d{2}", "%Y-%m-%d"),
+    "dd_mm_yyyy": (r"\d{2}-\d{2}-\d{4}", "%d-%m-%Y"),
+}
+
+# Columnas finales del bridge que se cargan a BigQuery
+BRIDGE_COLUMNS = [
+    'period', 'tenant', 'rut', 'cliente', 'instalacion', 'cecos', 'cargo', 'nombre_completo', 'tipo_empleado',
+    'estado', '_f_ingreso', '_f_finiquito', 'month_start', 'month_end',
+    'days_in_month', 'active_days', 'active_ratio', 'active_on_month_start',
+    'active_on_month_end', 'hire_in_month', 'term_in_month', 'term_causal_text',
+]
+
+_DIM = pa.dictionary(pa.int32(), pa.string())
+
+# Esquema fijo del bridge para la carga (Parquet/BigQuery), en el orden de BRIDGE_COLUMNS
+BRIDGE_ARROW_SCHEMA = pa.schema([
+    ("period", _DIM),
+    ("tenant", _DIM),
+    ("rut", _DIM),
+    ("cliente", _DIM),
+    ("instalacion", _DIM),
+    ("cecos", _DIM),
+    ("cargo", _DIM),
+    ("nombre_completo", _DIM),
+    ("tipo_empleado", _DIM),
+    ("estado", _DIM),
+    ("_f_ingreso", pa.date32()),
+    ("_f_finiquito", pa.date32()),
+    ("month_start", pa.date32()),
+    ("month_end", pa.date32()),
+    ("days_in_month", pa.int8()),
+    ("active_days", pa.int8()),
+    ("active_ratio", pa.float32()),
+    ("active_on_month_start", pa.int8()),
+    ("active_on_month_end", pa.int8()),
+    ("hire_in_month", pa.int8()),
+    ("term_in_month", pa.int8()),
+    ("term_causal_text", _DIM),
+])
+
+# Tabla compacta del modo de intervalos: una fila por empleado (la vista de views.py la expande a meses)
+INTERVAL_ARROW_SCHEMA = pa.schema([
+    ("tenant", _DIM),
+    ("rut", _DIM),
+    ("cliente", _DIM),
+    ("instalacion", _DIM),
+    ("cecos", _DIM),
+    ("cargo", _DIM),
+    ("nombre_completo", _DIM),
+    ("tipo_empleado", _DIM),
+    ("estado", _DIM),
+    ("_f_ingreso", pa.date32()),
+    ("_f_finiquito", pa.date32()),
+    ("_f_fin_efectivo", pa.date32()),
+    ("first_month", pa.date32()),
+    ("causal_finiquito", _DIM),
+])
+
+# Calendario de meses del modo de intervalos
+MONTH_ARROW_SCHEMA = pa.schema([
+    ("period", pa.string()),
+    ("month_start", pa.date32()),
+    ("month_end", pa.date32()),
+    ("days_in_month", pa.int8()),
+])
+
+# Rollups de KPI que se cargan junto al bridge: nombre -> dimensiones de agrupación
+ROLLUP_GRAINS = {
+    "cliente": ["tenant", "cliente"],
+    "instalacion": ["tenant", "cliente", "instalacion"],
+    "cecos": ["tenant", "cecos"],
+    "cargo": ["tenant", "cargo"],
+}
+
+# Desglose de finiquitos por causal: nombre -> dimensiones (además de la causal)
+CAUSAL_ROLLUP_GRAINS = {
+    "causal_cliente": ["tenant", "cliente"],
+    "causal_instalacion": ["tenant", "cliente", "instalacion"],
+}
+
+ROLLUP_METRICS = [
+    ("headcount_start", pa.int32()),
+    ("headcount_end", pa.int32()),
+    ("hires", pa.int32()),
+    ("terminations", pa.int32()),
+    ("fte", pa.float64()),
+    ("rotation_rate", pa.float64()),
+]
+
+def _robust_parse_date(s: pd.Series, stats: dict = None) -> pd.Series:
+    """
+    Parsea fechas 'YYYY-MM-DD', 'DD-MM-YYYY' o valores ya convertidos a fecha.
+
+    Cada valor distinto se clasifica por formato una sola vez (las fechas de
+    ingreso se repiten mucho) y cada formato fijo se parsea solo sobre su
+    subconjunto; lo que no calza se intenta con inferencia dayfirst. Si se
+    entrega `stats`, se llena con el conteo de filas por formato y de valores
+    no parseables. Retorna datetime64 a nivel de día.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        if stats is not None:
+            n_empty = int(s.isna().sum())
+            stats.update({"datetime": len(s) - n_empty, "empty": n_empty, "unparseable": 0})
+        return s.dt.normalize()
+
+    codes, uniques = pd.factorize(s)
+    uniq = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniq.index, dtype="datetime64[ns]")
+    kind = pd.Series("other", index=uniq.index, dtype=object)
+
+    is_dt = uniq.map(lambda v: isinstance(v, (datetime, date)))
+    if is_dt.any():
+        parsed[is_dt] = pd.to_datetime(uniq[is_dt])
+        kind[is_dt] = "datetime"
+
+    is_str = uniq.map(lambda v: isinstance(v, str))
+    text = uniq[is_str].str.strip()
+    kind[text.index[text == ""]] = "empty"
+    remaining = ~is_dt & (text.reindex(uniq.index) != "")
+    for name, (pattern, fmt) in DATE_FORMATS.items():
+        mask = remaining & text.reindex(uniq.index).str.fullmatch(pattern).fillna(False).astype(bool)
+        if mask.any():
+            parsed[mask] = pd.to_datetime(text[mask], format=fmt, errors="coerce")
+            kind[mask] = name
+            remaining &= ~mask
+
+    other = kind == "other"
+    if other.any():
+        parsed[other] = pd.to_datetime(
+            uniq[other].astype(str), errors="coerce", format="mixed", dayfirst=True
+        )
+
+    # El código -1 (nulos) toma el NaT agregado al final
+    values = np.append(parsed.values, np.datetime64("NaT", "ns"))
+    result = pd.Series(values[codes], index=s.index).dt.normalize()
+
+    if stats is not None:
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniq))
+        by_kind = pd.Series(counts, index=uniq.index).groupby(kind).sum()
+        stats.update({k: int(v) for k, v in by_kind.items()})
+        stats["empty"] = stats.get("empty", 0) + int((codes < 0).sum())
+        stats["unparseable"] = int(counts[(parsed.isna() & (kind != "empty")).values].sum())
+    return result
+
+def _to_days(s: pd.Series) -> np.ndarray:
+    """Convierte una columna datetime64 en un arreglo datetime64[D] (NaT se conserva)."""
+    return s.values.astype("datetime64[D]")
+
+def _dates_for_load(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte las columnas de fecha internas a objetos date para la carga/salida.
+
+    Las fechas nulas y las dimensiones categóricas vuelven a object con None
+    en los nulos, para que la salida JSON no contenga NaN ni "NaT".
+    """
+    df = df.copy()
+    for col in DATE_COLUMNS:
+        if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.date.astype(object).where(df[col].notna(), None)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+    return df
+
+def bridge_filters(filters=None) -> dict:
+    """Filtros pedidos completados con DEFAULT_FILTERS (un filtro ausente o en None toma el valor por defecto)."""
+    return {**DEFAULT_FILTERS, **{k: v for k, v in (filters or {}).items() if v is not None}}
+
+def _filter_text(value) -> str:
+    """Valor comparable de un filtro: texto sin espacios extremos ni mayúsculas (9999.0 se compara como 9999)."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip().casefold()
+
+def _matches(col: pd.Series, values) -> np.ndarray:
+    """True en las filas cuyo valor está en `values`; cada valor distinto se compara una sola vez."""
+    wanted = {_filter_text(v) for v in values}
+    codes, uniques = pd.factorize(col)
+    # El código -1 (nulos) toma el False agregado al final
+    hit = np.array([_filter_text(v) in wanted for v in uniques] + [False])
+    return hit[codes]
+
+def normalize_and_filter(df: pd.DataFrame,
+                         exclude_codes=None,
+                         exclude_texts=None,
+                         exclude_tipos=None,
+                         tipos=None) -> pd.DataFrame:
+    """
+    Filtra empleados por causal de finiquito (código o texto) y por tipo de
+    empleado, y normaliza fechas de los que quedan.
+
+    Los filtros se aplican primero, sobre una fila por empleado, para no
+    parsear fechas ni expandir a meses empleados que no entran al bridge.
+    """
+    filters = [
+        ("exclude_codes", "cod_causal_finiquito", exclude_codes, False),
+        ("exclude_texts", "causal_finiquito", exclude_texts, False),
+        ("exclude_tipos", "tipo_empleado", exclude_tipos, False),
+        ("tipos", "tipo_empleado", tipos, True),
+    ]
+    keep = np.ones(len(df), dtype=bool)
+    removed = {}
+    for name, col, values, include in filters:
+        if values is None or col not in df.columns:
+            continue
+        drop = keep & (_matches(df[col], values) != include)
+        removed[name] = int(drop.sum())
+        keep &= ~drop
+    if removed:
+        log(f"Filtros de empleados: {removed}", filters=removed, rows_in=len(df), rows_out=int(keep.sum()))
+    if not keep.all():
+        df = df.loc[keep]
+
+    # Copia superficial: se agregan columnas sin duplicar las existentes
+    df = df.copy(deep=False)
+
+    if "fecha_de_ingreso" not in df.columns:
+        raise ValueError("Falta columna fecha_de_ingreso")
+    if "fecha_finiquito" not in df.columns:
+        df["fecha_finiquito"] = np.nan
+
+    for src, dst in [("fecha_de_ingreso", "_f_ingreso"), ("fecha_finiquito", "_f_finiquito")]:
+        stats = {}
+        df[dst] = _robust_parse_date(df[src], stats=stats)
+        log(f"Fechas {src}: {stats}", column=src, formats=stats)
+
+    today_local = pd.Timestamp(datetime.today().date())
+    df["_f_fin_efectivo"] = df["_f_finiquito"].fillna(today_local)
+
+    return df
+
+def _month_window(filters) -> tuple:
+    """Ventana (primer mes, último mes) en meses desde 1970-01, o None si no se pidió período."""
+    filters = bridge_filters(filters)
+    if filters["period_from"] is None and filters["period_to"] is None:
+        return None
+    return tuple(
+        None if filters[key] is None else int(np.datetime64(filters[key], "M").astype(np.int64))
+        for key in ("period_from", "period_to")
+    )
+
+def _expand_employee_months(df: pd.DataFrame, min_month=None, window=None) -> tuple:
+    """
+    Expande cada empleado solo a los meses que se solapan con su vínculo.
+
+    Genera las filas empleado×mes desde el mes de ingreso hasta el mes de fin
+    efectivo con np.repeat/cumsum, de modo que la memoria depende del número
+    de filas de salida y no de empleados × meses del calendario completo.
+    Retorna la posición del empleado y el índice de mes (meses desde 1970-01)
+    de cada fila generada. `min_month` permite fijar el primer mes global
+    cuando se procesa solo una parte de los empleados. `window` (ver
+    _month_window) recorta el rango de cada empleado antes de generar filas,
+    así los meses fuera de la ventana no se materializan.
+    """
+    f_ingreso = _to_days(df["_f_ingreso"])
+    f_fin = _to_days(df["_f_fin_efectivo"])
+    ing_idx = f_ingreso.astype("datetime64[M]").astype(np.int64)
+    fin_idx = f_fin.astype("datetime64[M]").astype(np.int64)
+
+    # Igual que el cruce completo: sin fecha de ingreso se parte del primer mes
+    has_ingreso = ~np.isnat(f_ingreso)
+    if min_month is None and has_ingreso.any():
+        min_month = ing_idx[has_ingreso].min()
+    # Sin ninguna fecha de ingreso no hay primer mes: esos empleados no generan meses
+    start_idx = np.where(has_ingreso, ing_idx, fin_idx + 1 if min_month is None else min_month)
+    if window is not None:
+        first, last = window
+        if first is not None:
+            start_idx = np.maximum(start_idx, first)
+        if last is not None:
+            fin_idx = np.minimum(fin_idx, last)
+    n_months = np.clip(fin_idx - start_idx + 1, 0, None)
+
+    rows = np.repeat(np.arange(len(df)), n_months)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(n_months) - n_months, n_months)
+    month_idx = start_idx[rows] + offsets
+
+    return rows, month_idx
+
+def build_employee_month_bridge(df: pd.DataFrame, min_month=None, extra_columns=(), window=None) -> pd.DataFrame:
+    """Crea tabla empleado×mes con métricas de rotación (solo los meses de `window`, si se indica)."""
+    # Solo las columnas que llegan a la salida se replican por mes
+    df = df[[c for c in BRIDGE_SOURCE_COLUMNS + list(extra_columns) if c in df.columns]]
+    rows, month_idx = _expand_employee_months(df, min_month, window)
+
+    # Fechas del empleado en días, calculadas una vez y replicadas por fila
+    f_ingreso = _to_days(df["_f_ingreso"])[rows]
+    f_finiquito = _to_days(df["_f_finiquito"])[rows]
+    f_fin = _to_days(df["_f_fin_efectivo"])[rows]
+
+    month_start = month_idx.astype("datetime64[M]").astype("datetime64[D]")
+    month_end = (month_idx + 1).astype("datetime64[M]").astype("datetime64[D]") - np.timedelta64(1, "D")
+
+    start_ovl = np.where(np.isnat(f_ingreso), month_start, np.maximum(f_ingreso, month_start))
+    end_ovl = np.minimum(f_fin, month_end)
+    active_days = (end_ovl - start_ovl).astype(np.int64) + 1
+
+    keep = active_days > 0
+    rows, month_idx = rows[keep], month_idx[keep]
+    f_ingreso, f_finiquito, f_fin = f_ingreso[keep], f_finiquito[keep], f_fin[keep]
+    month_start, month_end = month_start[keep], month_end[keep]
+
+    x = df.iloc[rows].reset_index(drop=True)
+    x["month_start"] = month_start.astype("datetime64[ns]")
+    x["month_end"] = month_end.astype("datetime64[ns]")
+    x["days_in_month"] = ((month_end - month_start).astype(np.int64) + 1).astype(np.int8)
+    x["active_days"] = active_days[keep].astype(np.int8)
+
+    x["active_on_month_start"] = ((f_ingreso <= month_start) & (f_fin >= month_start)).astype(np.int8)
+    x["active_on_month_end"] = ((f_ingreso <= month_end) & (f_fin >= month_end)).astype(np.int8)
+
+    ing_m = f_ingreso.astype("datetime64[M]").astype(np.int64)
+    out_m = f_finiquito.astype("datetime64[M]").astype(np.int64)
+    x["hire_in_month"] = (~np.isnat(f_ingreso) & (ing_m == month_idx)).astype(np.int8)
+    x["term_in_month"] = (~np.isnat(f_finiquito) & (out_m == month_idx)).astype(np.int8)
+
+    if "cod_causal_finiquito" in x.columns:
+        x["term_causal_code"] = np.where(
+            x["term_in_month"].eq(1), x["cod_causal_finiquito"], pd.NA
+        )
+    else:
+        x["term_causal_code"] = pd.NA
+
+    if "causal_finiquito" in x.columns:
+        x["term_causal_text"] = np.where(
+            x["term_in_month"].eq(1), x["causal_finiquito"], pd.NA
+        )
+    else:
+        x["term_causal_text"] = pd.NA
+
+    x["active_ratio"] = x["active_days"] / x["days_in_month"]
+    x["period"] = np.datetime_as_string(month_idx.astype("datetime64[M]"), unit="M")
+
+    cols_dims = [c for c in [
+        "tenant", "rut", "nombre_completo", "cliente", "cecos", "cecosorigen",
+        "cargo","tipo_empleado", "estado", "instalacion","_f_ingreso","_f_finiquito","_f_fin_efectivo"
+    ] if c in x.columns]
+    cols_dates = ["month_start", "month_end", "period"]
+    cols_metrics = [
+        "days_in_month", "active_days", "active_ratio",
+        "active_on_month_start", "active_on_month_end",
+        "hire_in_month", "term_in_month", "term_causal_code", "term_causal_text"
+    ]
+
+    return x[cols_dims + cols_dates + cols_metrics + list(extra_columns)]
+
+def _global_min_month(df: pd.DataFrame):
+    """Primer mes de ingreso (meses desde 1970-01) de todo el conjunto de empleados (None si no hay)."""
+    ing_idx = _to_days(df["_f_ingreso"]).astype("datetime64[M]")
+    ing_idx = ing_idx[~np.isnat(ing_idx)]
+    return ing_idx.astype(np.int64).min() if len(ing_idx) else None
+
+def _build_bridge_shard(shard: pd.DataFrame, min_month, window=None) -> pd.DataFrame:
+    return build_employee_month_bridge(shard, min_month=min_month, extra_columns=["_pos"], window=window)
+
+def build_employee_month_bridge_parallel(df: pd.DataFrame, workers: int, shard_size: int,
+                                         executor: str = "process", window=None,
+                                         min_month=None) -> pd.DataFrame:
+    """
+    Construye el bridge por shards de empleados en un pool de procesos (o hilos).
+
+    Los empleados se reparten por hash de `rut` en shards de a lo más
+    `shard_size` empleados, cada uno se expande por separado y los resultados
+    se reordenan por la posición original del empleado, de modo que la salida
+    es idéntica a la de build_employee_month_bridge.
+
+    Cada shard se copia recién al enviarlo y hay a lo más `2 * workers` en
+    vuelo, de modo que el padre no duplica el DataFrame completo; los
+    resultados se recogen a medida que terminan.
+    """
+    n_shards = max(workers, -(-len(df) // shard_size))
+    shard_of = pd.util.hash_array(df["rut"].astype(str).values) % np.uint64(n_shards)
+    df = df.assign(_pos=np.arange(len(df)))
+    if min_month is None:
+        min_month = _global_min_month(df)
+
+    # Filas agrupadas por shard conservando el orden original dentro de cada uno
+    shard_rows = np.argsort(shard_of, kind="stable")
+    bounds = np.searchsorted(shard_of[shard_rows], np.arange(n_shards + 1, dtype=np.uint64))
+    non_empty = [i for i in range(n_shards) if bounds[i + 1] > bounds[i]]
+    log(f"🔀 Bridge en {len(non_empty)} shards con {workers} workers ({executor})",
+        shards=len(non_empty), workers=workers, executor=executor)
+
+    if executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=workers)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    parts = []
+    pending = set()
+    with pool:
+        for i in non_empty:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                parts.extend(future.result() for future in done)
+            shard = df.iloc[shard_rows[bounds[i]:bounds[i + 1]]]
+            pending.add(pool.submit(_build_bridge_shard, shard, min_month, window))
+        for future in wait(pending).done:
+            parts.append(future.result())
+
+    x = pd.concat(parts, ignore_index=True)
+    # Dentro de cada empleado los meses ya vienen ordenados; basta un orden estable por posición
+    x = x.sort_values("_pos", kind="stable").drop(columns="_pos")
+    return x.reset_index(drop=True)
+
+def build_bridge(df_norm: pd.DataFrame, window=None, min_month=None) -> pd.DataFrame:
+    """
+    Construye el bridge en paralelo si está configurado y el volumen lo justifica.
+    `min_month` fija el primer mes global cuando `df_norm` es solo parte de los empleados.
+    """
+    if BRIDGE_WORKERS > 1 and len(df_norm) > BRIDGE_SHARD_SIZE:
+        return build_employee_month_bridge_parallel(
+            df_norm, BRIDGE_WORKERS, BRIDGE_SHARD_SIZE, BRIDGE_EXECUTOR, window, min_month
+        )
+    return build_employee_month_bridge(df_norm, min_month=min_month, window=window)
+
+def build_employee_intervals(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tabla compacta del modo de intervalos: una fila por empleado con sus
+    dimensiones, fechas y causal, sin expandir a meses.
+
+    `first_month` es el primer mes que genera el bridge para el empleado: el
+    de ingreso o, sin fecha de ingreso, el primer mes global, de modo que la
+    vista no necesita conocer el resto de los empleados.
+    """
+    out = df[[c for c in INTERVAL_ARROW_SCHEMA.names if c in df.columns]].reset_index(drop=True)
+    for col in INTERVAL_ARROW_SCHEMA.names:
+        if col not in out.columns and col != "first_month":
+            out[col] = None
+    first = _to_days(out["_f_ingreso"]).astype("datetime64[M]")
+    min_month = _global_min_month(out)
+    if min_month is not None:
+        first = np.where(np.isnat(first), np.datetime64(int(min_month), "M"), first)
+    out["first_month"] = first.astype("datetime64[ns]")
+    return out[INTERVAL_ARROW_SCHEMA.names]
+
+def build_month_calendar(intervals: pd.DataFrame) -> pd.DataFrame:
+    """Calendario de meses que cubre todos los intervalos (del primer `first_month` al último fin efectivo)."""
+    first = _to_days(intervals["first_month"]).astype("datetime64[M]").min()
+    last = _to_days(intervals["_f_fin_efectivo"]).astype("datetime64[M]").max()
+    months = np.arange(first, last + 1)
+    month_start = months.astype("datetime64[D]")
+    month_end = (months + 1).astype("datetime64[D]") - np.timedelta64(1, "D")
+    return pd.DataFrame({
+        "period": np.datetime_as_string(months, unit="M"),
+        "month_start": month_start.astype("datetime64[ns]"),
+        "month_end": month_end.astype("datetime64[ns]"),
+        "days_in_month": ((month_end - month_start).astype(np.int64) + 1).astype(np.int8),
+    })
+
+# Tabla de traducción precompilada para los encabezados (se aplica después de lower())
+_HEADER_TRANSLATION = str.maketrans({
+    " ": "_", "-": "_",
+    ".": None, "%": None, "(": None, ")": None, "°": None,
+    "á": "a", "é": "e", "í": "i", "ó": "o", "ú": "u", "ñ": "n",
+})
+
+def _normalize_header(name: str) -> str:
+    """Normaliza un nombre de columna de ControlRoll a snake_case sin tildes."""
+    return name.lower().translate(_HEADER_TRANSLATION)
+
+# Encabezado normalizado del contrato -> columna destino
+_SOURCE_HEADERS = {_normalize_header(raw): target for target, (raw, _, _) in SOURCE_SCHEMA.items()}
+
+def _header_plan(signature: tuple) -> tuple:
+    """
+    Para un conjunto de encabezados crudos, el par (columna destino, encabezado
+    crudo) de cada columna del contrato presente; las demás se ignoran.
+    """
+    found = {}
+    for raw in signature:
+        target = _SOURCE_HEADERS.get(_normalize_header(raw))
+        if target is not None and target not in found:
+            found[target] = raw
+    return tuple(found.items())
+
+def _check_source_columns(found: set, headers: set):
+    """Error explícito si el reporte no trae alguna columna requerida del contrato."""
+    missing = [
+        f"{raw} ({target})"
+        for target, (raw, _, required) in SOURCE_SCHEMA.items()
+        if required and target not in found
+    ]
+    if missing:
+        raise ValueError(
+            f"El reporte de ControlRoll no trae columnas requeridas: {', '.join(missing)}. "
+            f"Encabezados recibidos: {sorted(headers)}"
+        )
+
+def _iter_json_records(chunks, encoding="utf-8"):
+    """
+    Decodifica incrementalmente un arreglo JSON de objetos.
+
+    Consume los bloques de bytes a medida que llegan y entrega un registro a
+    la vez, sin mantener el cuerpo completo en memoria.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)(errors="strict")
+    buf = ""
+    pos = 0
+    started = False
+    done = False
+
+    def _skip(buf, pos, chars):
+        while pos < len(buf) and buf[pos] in chars:
+            pos += 1
+        return pos
+
+    for chunk in chunks:
+        if done:
+            break
+        buf = buf[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        while True:
+            pos = _skip(buf, pos, " \t\r\n\ufeff" if not started else " \t\r\n,")
+            if pos >= len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("La respuesta de ControlRoll no es un arreglo JSON")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                done = True
+                break
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Registro incompleto: esperar el siguiente bloque
+                break
+            pos = end
+            yield record
+
+    buf = buf[pos:] + text_decoder.decode(b"", final=True)
+    if not done:
+        if not started and not buf.strip():
+            return
+        raise ValueError("Respuesta JSON de ControlRoll truncada o inválida")
+
+def _read_columns(records) -> tuple:
+    """
+    Acumula registros en buffers por columna, conservando solo las columnas del contrato.
+
+    La traducción de encabezados se resuelve una vez por firma (la tupla de
+    claves del registro, que en el reporte es la misma para casi todas las
+    filas) y luego solo se recorren las columnas usadas. Los registros sin una
+    columna quedan con None en esa posición. Retorna (columnas, cantidad de
+    registros, encabezados crudos vistos).
+    """
+    columns = {}
+    plans = {}
+    n = 0
+    for record in records:
+        signature = tuple(record)
+        plan = plans.get(signature)
+        if plan is None:
+            plan = plans[signature] = _header_plan(signature)
+        for target, raw in plan:
+            col = columns.get(target)
+            if col is None:
+                col = columns[target] = [None] * n
+            col.append(record[raw])
+        n += 1
+        if len(plan) < len(columns):
+            for col in columns.values():
+                if len(col) < n:
+                    col.append(None)
+    headers = {raw for signature in plans for raw in signature}
+    return columns, n, headers
+
+def configured_sources() -> list:
+    """
+    Fuentes de ControlRoll a sincronizar, cada una {"tenant", "url", "token"}.
+
+    CONTROLROLL_SOURCES es una lista JSON de objetos con `tenant`, `url` y
+    `token` o `token_env` (nombre de la variable de entorno que tiene el
+    token, para no dejarlo en la configuración). Sin ella hay una sola
+    fuente: API_LOCAL_URL + TOKEN_CR con la etiqueta TENANT.
+    """
+    if not CONTROLROLL_SOURCES:
+        return [{"tenant": TENANT, "url": API_LOCAL_URL, "token": TOKEN}]
+    sources = []
+    for i, entry in enumerate(json.loads(CONTROLROLL_SOURCES)):
+        missing = [key for key in ("tenant", "url") if not entry.get(key)]
+        if missing:
+            raise ValueError(f"CONTROLROLL_SOURCES[{i}]: faltan {missing}")
+        token = entry.get("token") or (os.getenv(entry["token_env"]) if entry.get("token_env") else None)
+        sources.append({"tenant": str(entry["tenant"]), "url": entry["url"], "token": token})
+    tenants = [source["tenant"] for source in sources]
+    repeated = sorted({t for t in tenants if tenants.count(t) > 1})
+    if repeated:
+        raise ValueError(f"CONTROLROLL_SOURCES: tenants repetidos {repeated}")
+    return sources
+
+@metrics.timed("download")
+def download_payload(force_refresh=False, source=None) -> dict:
+    """
+    Descarga el reporte de una fuente de ControlRoll (por defecto, la única
+    configurada) a la cache en disco (comprimido).
+
+    Si hay una copia vigente para la misma URL, método y día se reutiliza sin
+    llamar a la API, salvo que se pida force_refresh. Si hay una copia vencida
+    del día, la llamada es condicional y ante un 304 se reutiliza. Una
+    descarga cortada se retoma desde lo ya recibido (ver ControlRollClient).
+    Retorna los metadatos del payload (ruta, hash de contenido y bytes).
+
+    Las descargas de la misma clave se serializan: quien espera el lock
+    reutiliza el payload que dejó la descarga anterior, aun con force_refresh
+    si esa descarga terminó después de este pedido.
+    """
+    source = source or configured_sources()[0]
+    cache_key = PayloadCache.key(source["url"], "report", datetime.today().date())
+    requested_at = time.time()
+    with CACHE.lock(cache_key):
+        meta = CACHE.get_payload(cache_key)
+        if meta is not None and (not force_refresh or meta["created_at"] >= requested_at):
+            log(f"♻️ Usando payload en cache ({meta['bytes']} bytes, sha256 {meta['sha256'][:12]})",
+                cached=True, payload_bytes=meta["bytes"], tenant=source["tenant"])
+            return meta
+        return _download_to_cache(source, cache_key)
+
+def _download_to_cache(source, cache_key) -> dict:
+    """Descarga el reporte al archivo parcial de `cache_key` y lo registra en cache (con el lock tomado)."""
+    url, tenant = source["url"], source["tenant"]
+    previous = CACHE.get_payload(cache_key, ignore_ttl=True)
+
+    # Preparar parámetros para la API local (el token no se registra en los logs)
+    headers = {
+        "method": "report",
+        "token": source["token"]
+    }
+    
+    try:
+        log("🔄 Iniciando llamada a ControlRoll...", url=url, tenant=tenant)
+        result = CONTROLROLL.download(
+            url, headers, CACHE.partial_path(cache_key),
+            validators=previous.get("validators") if previous else None,
+        )
+        if result["status"] == "not_modified":
+            meta = CACHE.touch_payload(cache_key)
+            log(f"♻️ ControlRoll respondió 304, se reutiliza el payload en cache ({meta['bytes']} bytes)",
+                cached=True, not_modified=True, payload_bytes=meta["bytes"], tenant=tenant)
+            return meta
+        meta = CACHE.commit_partial(
+            cache_key,
+            encoding=result["encoding"],
+            validators={"etag": result["etag"], "last_modified": result["last_modified"]},
+        )
+        CACHE.mark_latest(url, meta)
+        metrics.record(bytes=result["received_bytes"])
+        log(f"✅ Llamada completada ({meta['bytes']} bytes)", payload_bytes=meta["bytes"],
+            resumed_bytes=result["resumed_bytes"], received_bytes=result["received_bytes"],
+            attempts=result["attempts"], tenant=tenant)
+    except requests.exceptions.Timeout:
+        error_msg = f"Timeout: La API externa no respondió en {CONTROLROLL_READ_TIMEOUT:.0f}s tras {CONTROLROLL_RETRIES} reintentos"
+        log(f"❌ {error_msg}", severity="ERROR", tenant=tenant)
+        raise HTTPException(status_code=504, detail=error_msg)
+    except requests.exceptions.ConnectionError as e:
+        error_msg = f"Error de conexión con la API externa: {str(e)}"
+        log(f"❌ {error_msg}", severity="ERROR", tenant=tenant)
+        raise HTTPException(status_code=502, detail=error_msg)
+    except requests.exceptions.RequestException as e:
+        error_msg = f"Error en la petición HTTP: {str(e)}"
+        log(f"❌ {error_msg}", severity="ERROR", tenant=tenant)
+        raise HTTPException(status_code=502, detail=error_msg)
+    except Exception as e:
+        error_msg = f"Error inesperado: {type(e).__name__}: {str(e)}"
+        log(f"❌ {error_msg}", severity="ERROR", exc_info=True, tenant=tenant)
+        raise HTTPException(status_code=500, detail=error_msg)
+    return meta
+
+@metrics.timed("decode")
+def read_payload(meta: dict):
+    """Decodifica el payload en cache como DataFrame (None si viene vacío)"""
+    records = _iter_json_records(
+        PayloadCache.iter_payload(meta, INGEST_CHUNK_SIZE),
+        encoding=meta["encoding"],
+    )
+    columns, n_records, headers = _read_columns(records)
+    metrics.record(bytes=meta["bytes"], rows_out=n_records)
+    log(f"Datos obtenidos: {n_records} registros", records=n_records)
+    
+    if n_records == 0:
+        log("No hay datos para procesar")
+        return None
+    _check_source_columns(set(columns), headers)
+
+    # Convertir a DataFrame directamente desde los buffers por columna; las
+    # dimensiones quedan como categóricas y se liberan los buffers a medida
+    data = pd.DataFrame(index=pd.RangeIndex(n_records))
+    for name in list(columns):
+        values = columns.pop(name)
+        data[name] = pd.Categorical(values) if name in CATEGORICAL_COLUMNS else values
+    return data
+
+def fetch_report_data(force_refresh=False):
+    """Obtiene el reporte de ControlRoll como DataFrame junto al hash del payload"""
+    meta = download_payload(force_refresh)
+    return read_payload(meta), meta["sha256"]
+
+@metrics.timed("normalize")
+def prepare_employees(data: pd.DataFrame, tenant=None, filters=None) -> pd.DataFrame:
+    """Filtra los empleados que entran al bridge (ver DEFAULT_FILTERS), normaliza fechas y los etiqueta con su tenant"""
+    filters = bridge_filters(filters)
+    df_norm = normalize_and_filter(
+        data, exclude_codes=filters["exclude_codes"], exclude_texts=filters["exclude_texts"],
+        exclude_tipos=filters["exclude_tipos"], tipos=filters["tipos"],
+    )
+    df_norm = df_norm.assign(tenant=pd.Categorical.from_codes(
+        np.zeros(len(df_norm), dtype=np.int8), categories=[tenant or TENANT]
+    ))
+    metrics.record(rows_in=len(data), rows_out=len(df_norm))
+    return df_norm
+
+def _per_source(fn, items):
+    """
+    Aplica `fn` a cada elemento en hilos (hasta SOURCE_CONCURRENCY a la vez).
+
+    Retorna [(resultado, error, segundos)] en el orden de `items`; la falla
+    de un elemento queda en su `error` y no interrumpe a los demás. Los
+    hilos quedan asociados al job en curso para que sus logs lleven su id.
+    """
+    job = jobs.current()
+
+    def run(item):
+        with jobs.attached(job):
+            t0 = time.perf_counter()
+            try:
+                return fn(item), None, round(time.perf_counter() - t0, 3)
+            except Exception as e:
+                detail = getattr(e, "detail", None)
+                error = detail if detail is not None else f"{type(e).__name__}: {str(e)}"
+                return None, error, round(time.perf_counter() - t0, 3)
+
+    with ThreadPoolExecutor(max_workers=min(SOURCE_CONCURRENCY, len(items)), thread_name_prefix="source") as pool:
+        return list(pool.map(run, items))
+
+def download_sources(force_refresh=False):
+    """
+    Descarga los payloads de todas las fuentes configuradas, en paralelo.
+
+    Con una sola fuente se comporta como download_payload: un error detiene
+    el proceso. Con varias, la falla de una no detiene a las demás. Se usa
+    el último payload bueno de ese tenant (estado `stale`) para no dejar sus
+    filas fuera de la carga. Si no hay uno, queda en estado `failed` y
+    read_sources detiene la carga. Retorna [(fuente, meta)], el hash combinado de
+    esos payloads y el reporte por tenant.
+    """
+    sources = configured_sources()
+    if len(sources) == 1:
+        results = [(download_payload(force_refresh, sources[0]), None, None)]
+    else:
+        jobs.stage("download")
+        log(f"🌐 Descargando {len(sources)} fuentes de ControlRoll ({SOURCE_CONCURRENCY} en paralelo como máximo)",
+            sources=len(sources), concurrency=SOURCE_CONCURRENCY)
+        results = _per_source(lambda source: download_payload(force_refresh, source), sources)
+
+    downloaded, reports = [], []
+    for source, (meta, error, seconds) in zip(sources, results):
+        report = {"tenant": source["tenant"], "status": "ok", "download_seconds": seconds}
+        if error is not None:
+            meta = CACHE.latest_payload(source["url"])
+            report.update(status="stale" if meta else "failed", error=error)
+            log(f"❌ Fuente {source['tenant']} falló: "
+                + ("se carga su último payload disponible" if meta else "queda fuera de esta carga"),
+                severity="ERROR", tenant=source["tenant"], stale=meta is not None, error=error)
+        if meta is not None:
+            downloaded.append((source, meta))
+            report.update(payload_bytes=meta["bytes"], sha256=meta["sha256"][:12])
+        reports.append(report)
+    if not downloaded:
+        raise HTTPException(status_code=502, detail={
+            "message": "Ninguna fuente de ControlRoll pudo descargarse",
+            "sources": reports,
+        })
+
+    combined = "|".join(f"{source['tenant']}:{meta['sha256']}" for source, meta in downloaded)
+    return downloaded, hashlib.sha256(combined.encode()).hexdigest(), reports
+
+def _concat_employees(frames) -> pd.DataFrame:
+    """
+    Une los empleados de varias fuentes. Las dimensiones siguen siendo
+    categóricas (unión de categorías) y una columna opcional que falta en
+    una fuente queda nula en sus filas.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    categorical = {
+        col for col in columns
+        if any(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames if col in frame.columns)
+    }
+    merged = {}
+    for col in columns:
+        if col in categorical:
+            merged[col] = pd.api.types.union_categoricals([
+                pd.Categorical(frame[col]) if col in frame.columns else pd.Categorical([None] * len(frame))
+                for frame in frames
+            ], ignore_order=True)
+        else:
+            merged[col] = pd.concat([
+                frame[col] if col in frame.columns else pd.Series([None] * len(frame), dtype=object)
+                for frame in frames
+            ], ignore_index=True)
+    return pd.DataFrame(merged)
+
+def read_sources(downloaded, reports, filters=None):
+    """
+    Decodifica y normaliza los payloads descargados (en paralelo si son varios)
+    y los une en un solo conjunto de empleados con la dimensión `tenant`.
+
+    Con varias fuentes, una que falla al decodificar se marca en su reporte.
+    Si alguna fuente quedó en estado `failed` (sin payload ni copia anterior,
+    o sin poder decodificarse) no se sigue: cargar sin ese tenant borraría sus
+    filas ya cargadas del destino y de las rollups. Retorna None si no hay
+    empleados.
+    """
+    def read(item):
+        source, meta = item
+        data = read_payload(meta)
+        return None if data is None else prepare_employees(data, source["tenant"], filters)
+
+    if len(downloaded) == 1:
+        frames = [read(downloaded[0])]
+    else:
+        jobs.stage("decode")
+        by_tenant = {report["tenant"]: report for report in reports}
+        frames = []
+        for (source, _), (df_norm, error, seconds) in zip(downloaded, _per_source(read, downloaded)):
+            report = by_tenant[source["tenant"]]
+            report["read_seconds"] = seconds
+            if error is not None:
+                report.update(status="failed", error=error)
+                log(f"❌ Fuente {source['tenant']} falló al decodificar",
+                    severity="ERROR", tenant=source["tenant"], error=error)
+            frames.append(df_norm)
+    for (source, _), df_norm in zip(downloaded, frames):
+        if df_norm is not None:
+            next(r for r in reports if r["tenant"] == source["tenant"])["employees"] = len(df_norm)
+
+    failed = [report["tenant"] for report in reports if report["status"] == "failed"]
+    if failed:
+        log(f"❌ Fuentes sin datos: {failed}; no se carga para no borrar sus filas del destino",
+            severity="ERROR", failed=failed)
+        raise HTTPException(status_code=502, detail={
+            "message": f"Fuentes de ControlRoll sin datos disponibles: {failed}; la carga no se realizó "
+                       "para conservar sus filas en el destino",
+            "sources": reports,
+        })
+
+    # Una fuente sin empleados tras los filtros no aporta filas; si no queda ninguna no hay datos
+    frames = [frame for frame in frames if frame is not None and len(frame)]
+    if not frames:
+        log("No hay empleados para procesar tras los filtros")
+        return None
+    return _concat_employees(frames)
+
+def _bridge_key(payload_hash: str, filters=None) -> str:
+    """Clave del bridge en cache: el hash del payload, combinado con los filtros si no son los por defecto"""
+    filters = bridge_filters(filters)
+    if filters == DEFAULT_FILTERS:
+        return payload_hash
+    return hashlib.sha256(f"{payload_hash}|{json.dumps(filters, sort_keys=True)}".encode()).hexdigest()
+
+def _cached_bridge(payload_hash: str, force_refresh=False):
+    """Bridge en cache para este payload y día (None si no hay o si se fuerza la recarga)"""
+    if force_refresh:
+        return None
+    df_bridge = CACHE.get_bridge(payload_hash, datetime.today().date())
+    if df_bridge is not None:
+        log(f"♻️ Usando bridge en cache: {len(df_bridge)} registros", cached=True, records=len(df_bridge))
+    return df_bridge
+
+@metrics.timed("bridge")
+def _build_and_cache_bridge(df_norm: pd.DataFrame, payload_hash: str, window=None) -> pd.DataFrame:
+    df_bridge = build_bridge(df_norm, window)[BRIDGE_COLUMNS]
+    CACHE.put_bridge(payload_hash, datetime.today().date(), df_bridge)
+    metrics.record(rows_in=len(df_norm), rows_out=len(df_bridge))
+    memory_mb = df_bridge.memory_usage(deep=True).sum() / 1024 ** 2
+    log(f"✅ Datos procesados exitosamente: {len(df_bridge)} registros ({memory_mb:.1f} MB en memoria)",
+        records=len(df_bridge), memory_mb=round(memory_mb, 1))
+    return df_bridge
+
+def fetch_and_process_data(force_refresh=False, filters=None):
+    """Función para obtener y procesar datos de la API externa. Retorna (bridge, reporte por tenant)"""
+    log("=== OBTENIENDO Y PROCESANDO DATOS ===")
+    downloaded, payload_hash, sources = download_sources(force_refresh)
+    bridge_key = _bridge_key(payload_hash, filters)
+    df_bridge = _cached_bridge(bridge_key, force_refresh)
+    if df_bridge is not None:
+        return df_bridge, sources
+
+    # Procesar datos de rotación
+    df_norm = read_sources(downloaded, sources, filters)
+    if df_norm is None:
+        return None, sources
+    return _build_and_cache_bridge(df_norm, bridge_key, _month_window(filters)), sources
+
+def _load_marker(filters=None) -> dict:
+    """
+    Campos extra del registro de carga: cambiar de modo de salida o de
+    filtros obliga a recargar el mismo payload.
+    """
+    marker = {"output_mode": OUTPUT_MODE} if OUTPUT_MODE == "intervals" else {}
+    filters = bridge_filters(filters)
+    if filters != DEFAULT_FILTERS:
+        marker["filters"] = filters
+    return marker
+
+def _payload_unchanged(sink, payload_hash, filters=None) -> bool:
+    """True si este mismo payload ya se cargó hoy al destino (con el mismo modo de salida y filtros)."""
+    last = CACHE.last_loaded(sink.describe())
+    return last == {"sha256": payload_hash, "day": str(datetime.today().date()), **_load_marker(filters)}
+
+def bigquery_client() -> bigquery.Client:
+    """
+    Cliente BigQuery de la instancia. Se crea una sola vez (resolver
+    credenciales y armar la sesión HTTP toma tiempo) y se reutiliza en cada
+    carga hasta que se cierra con close_clients.
+    """
+    global _BIGQUERY_CLIENT
+    with _BIGQUERY_CLIENT_LOCK:
+        if _BIGQUERY_CLIENT is None:
+            _BIGQUERY_CLIENT = bigquery.Client(project=PROJECT_ID)
+        return _BIGQUERY_CLIENT
+
+def close_clients():
+    """Cierra las conexiones de los clientes compartidos (al apagar la instancia)."""
+    global _BIGQUERY_CLIENT
+    with _BIGQUERY_CLIENT_LOCK:
+        if _BIGQUERY_CLIENT is not None:
+            _BIGQUERY_CLIENT.close()
+            _BIGQUERY_CLIENT = None
+    CONTROLROLL.session.close()
+
+def get_sink():
+    """Destino de carga configurado: BigQuery (por defecto) o archivos locales."""
+    if LOAD_SINK == "local":
+        return LocalSink(LOCAL_SINK_DIR, TABLE_ID or "rotacion")
+    return BigQuerySink(PROJECT_ID, DATASET_ID, TABLE_ID, client=bigquery_client(),
+                        artifact_dir=LOAD_ARTIFACT_DIR)
+
+def to_arrow_table(df_bridge: pd.DataFrame, schema: pa.Schema = BRIDGE_ARROW_SCHEMA) -> pa.Table:
+    """
+    Convierte el bridge (o la tabla de intervalos, con su `schema`) a una
+    tabla Arrow con el esquema declarado de carga.
+
+    Las fechas pasan directo de datetime64 a date32 y las dimensiones quedan
+    codificadas como diccionario, sin inferencia de tipos fila a fila.
+    """
+    df = df_bridge[schema.names]
+    for field in schema:
+        col = df[field.name]
+        if field.type != _DIM:
+            continue
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            if pd.api.types.infer_dtype(col.cat.categories) != "string":
+                df = df.assign(**{field.name: col.cat.rename_categories(col.cat.categories.astype(str))})
+        elif pd.api.types.infer_dtype(col) not in ("string", "empty"):
+            df = df.assign(**{field.name: col.where(col.isna(), col.astype(str))})
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+def partition_checksums(df_bridge: pd.DataFrame) -> dict:
+    """Checksum por partición mensual: cantidad de filas y suma de hashes (independiente del orden)."""
+    hashes = pd.DataFrame({
+        "pid": df_bridge["month_start"].dt.strftime("%Y%m").values,
+        "h": pd.util.hash_pandas_object(df_bridge[BRIDGE_COLUMNS], index=False).values,
+    })
+    return {
+        pid: f"{len(h)}:{int(np.sum(h.values, dtype=np.uint64)):016x}"
+        for pid, h in hashes.groupby("pid")["h"]
+    }
+
+def _in_window(pid: str, window) -> bool:
+    """True si la partición 'YYYYMM' cae dentro de la ventana (None = sin ventana)."""
+    if window is None:
+        return True
+    month = int(np.datetime64(f"{pid[:4]}-{pid[4:]}", "M").astype(np.int64))
+    first, last = window
+    return (first is None or month >= first) and (last is None or month <= last)
+
+def _has_window_baseline(sink) -> bool:
+    """True si el destino admite una carga por ventana: tabla particionada con checksums guardados."""
+    return sink.is_partitioned() and bool(sink.read_checksums())
+
+def _check_window_baseline(window, old_checksums):
+    """
+    Una ventana solo reemplaza sus particiones: sin una tabla particionada con
+    checksums la carga sería completa y borraría los meses fuera de la ventana.
+    """
+    if window is not None and not old_checksums:
+        raise ValueError("La ventana de período requiere una tabla particionada ya cargada; "
+                         "haga primero una carga sin period_from/period_to")
+
+@metrics.timed("load")
+def load_to_bigquery(df_bridge, sink=None, window=None):
+    """
+    Función para cargar datos procesados a BigQuery.
+
+    La tabla está particionada por mes; solo se reemplazan las particiones cuyo
+    checksum cambió y se eliminan las que ya no tienen filas. Con `window`
+    (bridge de una ventana de meses) solo se tocan las particiones de la
+    ventana y se conservan los checksums de las demás.
+    """
+    if df_bridge is None:
+        return {
+            "success": True,
+            "message": "No hay datos para cargar",
+            "records_processed": 0
+        }
+    
+    log("=== CARGANDO DATOS A BIGQUERY ===")
+    
+    try:
+        sink = sink or get_sink()
+        new_checksums = partition_checksums(df_bridge)
+        partitioned = sink.is_partitioned()
+        old_checksums = sink.read_checksums() if partitioned else {}
+
+        t0 = time.perf_counter()
+        table = to_arrow_table(df_bridge)
+        serialize_seconds = time.perf_counter() - t0
+
+        _check_window_baseline(window, old_checksums)
+        if not old_checksums:
+            log(f"🔄 Carga completa de {len(df_bridge)} registros: {sink.describe()}", destination=sink.describe())
+            upload_bytes = sink.write_full(table)
+            replaced, deleted = sorted(new_checksums), []
+        else:
+            replaced = [pid for pid, c in new_checksums.items() if old_checksums.get(pid) != c]
+            deleted = [pid for pid in sink.partitions() if pid not in new_checksums and _in_window(pid, window)]
+            log(f"🔄 Reemplazando {len(replaced)} particiones de {len(new_checksums)}: {sink.describe()}",
+                destination=sink.describe())
+            pids = partition_ids(table)
+            upload_bytes = 0
+            for pid in replaced:
+                upload_bytes += sink.replace_partition(pid, table.filter(pa.array(pids == pid)))
+            for pid in deleted:
+                sink.delete_partition(pid)
+        # Las particiones fuera de la ventana no se revisaron: no cuentan como omitidas
+        skipped = len(new_checksums) - len(replaced)
+        if window is not None:
+            new_checksums = {
+                **{pid: c for pid, c in old_checksums.items() if not _in_window(pid, window)},
+                **new_checksums,
+            }
+        sink.write_checksums(new_checksums)
+        
+        serialization = {
+            "serialize_seconds": round(serialize_seconds, 3),
+            "arrow_bytes": table.nbytes,
+            "upload_bytes": upload_bytes,
+        }
+        metrics.record(rows_in=len(df_bridge), bytes=upload_bytes)
+        log(f"✅ Data cargada exitosamente. {len(df_bridge)} registros, "
+            f"{len(replaced)} particiones reemplazadas, {len(deleted)} eliminadas.",
+            records=len(df_bridge), partitions_replaced=len(replaced),
+            partitions_deleted=len(deleted), **serialization)
+        
+        return {
+            "success": True,
+            "message": "Data procesada y cargada exitosamente",
+            "records_processed": len(df_bridge),
+            "partitions_replaced": len(replaced),
+            "partitions_skipped": skipped,
+            "partitions_deleted": len(deleted),
+            "serialization": serialization
+        }
+    except Exception as e:
+        error_msg = f"Error al cargar datos en BigQuery: {type(e).__name__}: {str(e)}"
+        log(f"❌ {error_msg}", severity="ERROR", exc_info=True)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+def build_rollups(df_bridge: pd.DataFrame) -> dict:
+    """
+    Calcula los KPI mensuales (ver `kpi_aggregate`) por cada grano de
+    ROLLUP_GRAINS y el desglose de finiquitos por causal de CAUSAL_ROLLUP_GRAINS.
+    """
+    rollups = {
+        name: kpi_aggregate(df_bridge, ["month_start"] + dims)
+        for name, dims in ROLLUP_GRAINS.items()
+    }
+
+    terminated = df_bridge.loc[df_bridge["term_in_month"] == 1]
+    for name, dims in CAUSAL_ROLLUP_GRAINS.items():
+        keys = ["month_start"] + dims + ["term_causal_text"]
+        counts = terminated[keys].groupby(keys, observed=True, sort=True, dropna=False).size()
+        rollups[name] = counts.rename("terminations").reset_index()
+    return rollups
+
+def to_rollup_table(df_rollup: pd.DataFrame) -> pa.Table:
+    """Convierte una rollup a Arrow: período 'YYYY-MM', month_start date32, dimensiones string y métricas tipadas."""
+    types = dict(ROLLUP_METRICS)
+    df = df_rollup.copy()
+    df.insert(0, "period", df["month_start"].dt.strftime("%Y-%m"))
+    df["month_start"] = df["month_start"].dt.date
+    fields = []
+    for col in df.columns:
+        if col == "month_start":
+            fields.append((col, pa.date32()))
+        elif col in types:
+            fields.append((col, types[col]))
+        else:
+            values = df[col].astype(object)
+            df[col] = values.where(values.notna(), None)
+            fields.append((col, pa.string()))
+    return pa.Table.from_pandas(df, schema=pa.schema(fields), preserve_index=False)
+
+@metrics.timed("rollups")
+def load_rollups(df_bridge: pd.DataFrame, sink=None, rollups=None) -> dict:
+    """
+    Calcula las rollups de KPI y las carga como tablas pequeñas separadas
+    (`<tabla>__kpi_<nombre>`), reemplazando su contenido completo.
+    `rollups` ya calculadas (ver load_pipelined) se cargan sin recalcularlas.
+    """
+    try:
+        sink = sink or get_sink()
+        loaded = {}
+        for name, df_rollup in (rollups if rollups is not None else build_rollups(df_bridge)).items():
+            size = sink.write_rollup(name, to_rollup_table(df_rollup))
+            loaded[name] = {"rows": len(df_rollup), "bytes": size}
+        if df_bridge is not None:
+            metrics.record(rows_in=len(df_bridge))
+        metrics.record(rows_out=sum(r["rows"] for r in loaded.values()),
+                       bytes=sum(r["bytes"] for r in loaded.values()))
+        summary = ", ".join(f"{name} ({r['rows']})" for name, r in loaded.items())
+        log(f"✅ Rollups de KPI cargadas: {summary}", rollups=loaded)
+        return loaded
+    except Exception as e:
+        error_msg = f"Error al cargar rollups de KPI: {type(e).__name__}: {str(e)}"
+        log(f"❌ {error_msg}", severity="ERROR", exc_info=True)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+def _chunk_windows(df_norm: pd.DataFrame, window=None, chunk_months: int = LOAD_CHUNK_MONTHS) -> list:
+    """
+    Rangos de `chunk_months` meses (en el formato de _month_window) que cubren
+    el bridge completo, o solo `window` si se indica.
+    """
+    ing_idx = _to_days(df_norm["_f_ingreso"]).astype("datetime64[M]")
+    fin_idx = _to_days(df_norm["_f_fin_efectivo"]).astype("datetime64[M]")
+    if np.isnat(ing_idx).all() or np.isnat(fin_idx).all():
+        return []
+    first = int(ing_idx[~np.isnat(ing_idx)].astype(np.int64).min())
+    last = int(fin_idx[~np.isnat(fin_idx)].astype(np.int64).max())
+    if window is not None:
+        first = first if window[0] is None else max(first, window[0])
+        last = last if window[1] is None else min(last, window[1])
+    return [(m, min(m + chunk_months - 1, last)) for m in range(first, last + 1, chunk_months)]
+
+def _merge_rollups(parts) -> dict:
+    """Une las rollups calculadas por chunk; los chunks no comparten meses, así que basta concatenar."""
+    if not parts:
+        return {}
+    return {name: pd.concat([part[name] for part in parts], ignore_index=True) for name in parts[0]}
+
+@metrics.timed("load")
+def load_pipelined(df_norm: pd.DataFrame, sink=None, window=None, rollups=False) -> tuple:
+    """
+    Construye el bridge por rangos de LOAD_CHUNK_MONTHS meses y lo sube
+    mientras se genera. Retorna (resultado, rollups o None).
+
+    Este hilo produce los chunks en una cola acotada (LOAD_QUEUE_DEPTH) y un
+    hilo consumidor serializa y sube a la tabla de staging las particiones que
+    cambiaron. Al final el staging se aplica al destino en un solo paso (ver
+    commit_staging), así una falla a mitad de camino no deja la tabla a medias.
+
+    Cada partición queda completa dentro de un chunk, por lo que los checksums
+    y las rollups mensuales se calculan por chunk. El bridge completo nunca
+    está en memoria: no se guarda en cache ni se publica en el índice.
+    """
+    log("=== CARGANDO BRIDGE A BIGQUERY POR CHUNKS ===")
+    try:
+        sink = sink or get_sink()
+        partitioned = sink.is_partitioned()
+        old_checksums = sink.read_checksums() if partitioned else {}
+        _check_window_baseline(window, old_checksums)
+        full = not old_checksums
+        chunks = _chunk_windows(df_norm, window)
+        log(f"🔄 Carga por chunks: {len(chunks)} chunks de {LOAD_CHUNK_MONTHS} meses, "
+            f"cola de {LOAD_QUEUE_DEPTH}: {sink.describe()}",
+            destination=sink.describe(), chunks=len(chunks), full=full)
+
+        new_checksums, replaced, rollup_parts, errors = {}, [], [], []
+        stats = {"build_seconds": 0.0, "serialize_seconds": 0.0, "upload_seconds": 0.0,
+                 "arrow_bytes": 0, "upload_bytes": 0}
+        chunk_queue = queue.Queue(maxsize=max(LOAD_QUEUE_DEPTH, 1))
+        job = jobs.current()
+
+        def consume():
+            with jobs.attached(job):
+                while True:
+                    item = chunk_queue.get()
+                    if item is None:
+                        return
+                    if errors:
+                        # Tras una falla se sigue vaciando la cola para no bloquear al productor
+                        continue
+                    i, df_chunk = item
+                    try:
+                        checksums = partition_checksums(df_chunk)
+                        changed = [pid for pid, c in checksums.items() if full or old_checksums.get(pid) != c]
+                        new_checksums.update(checksums)
+                        t0 = time.perf_counter()
+                        table = to_arrow_table(df_chunk)
+                        if len(changed) < len(checksums):
+                            table = table.filter(pa.array(np.isin(partition_ids(table), changed)))
+                        t1 = time.perf_counter()
+                        if table.num_rows:
+                            stats["upload_bytes"] += sink.stage_chunk(table, f"chunk-{i:04d}")
+                        stats["serialize_seconds"] += t1 - t0
+                        stats["upload_seconds"] += time.perf_counter() - t1
+                        stats["arrow_bytes"] += table.nbytes
+                        replaced.extend(changed)
+                    except Exception as e:
+                        errors.append(e)
+
+        sink.begin_staging()
+        consumer = threading.Thread(target=consume, name="load-consumer", daemon=True)
+        t_start = time.perf_counter()
+        consumer.start()
+        rows = 0
+        try:
+            for i, chunk in enumerate(chunks):
+                if errors:
+                    break
+                t0 = time.perf_counter()
+                df_chunk = build_bridge(df_norm, chunk)[BRIDGE_COLUMNS]
+                if rollups:
+                    rollup_parts.append(build_rollups(df_chunk))
+                stats["build_seconds"] += time.perf_counter() - t0
+                rows += len(df_chunk)
+                chunk_queue.put((i, df_chunk))
+                # Sin esta referencia el chunk se libera apenas el consumidor lo sube
+                del df_chunk
+        finally:
+            chunk_queue.put(None)
+            consumer.join()
+        if errors:
+            raise errors[0]
+
+        deleted = [pid for pid in sink.partitions() if pid not in new_checksums and _in_window(pid, window)]
+        sink.commit_staging(sorted(replaced), deleted, full)
+        skipped = len(new_checksums) - len(replaced)
+        if window is not None:
+            new_checksums = {
+                **{pid: c for pid, c in old_checksums.items() if not _in_window(pid, window)},
+                **new_checksums,
+            }
+        sink.write_checksums(new_checksums)
+        wall_seconds = time.perf_counter() - t_start
+
+        serialization = {
+            "serialize_seconds": round(stats["serialize_seconds"], 3),
+            "arrow_bytes": stats["arrow_bytes"],
+            "upload_bytes": stats["upload_bytes"],
+        }
+        pipelining = {
+            "chunks": len(chunks),
+            "build_seconds": round(stats["build_seconds"], 3),
+            "upload_seconds": round(stats["upload_seconds"], 3),
+            "wall_seconds": round(wall_seconds, 3),
+        }
+        metrics.record(rows_in=len(df_norm), rows_out=rows, bytes=stats["upload_bytes"])
+        log(f"✅ Data cargada por chunks. {rows} registros, {len(replaced)} particiones reemplazadas, "
+            f"{len(deleted)} eliminadas, {wall_seconds:.2f}s (bridge {stats['build_seconds']:.2f}s, "
+            f"subida {stats['upload_seconds']:.2f}s)",
+            records=rows, partitions_replaced=len(replaced), partitions_deleted=len(deleted),
+            **serialization, **pipelining)
+        result = {
+            "success": True,
+            "message": "Data procesada y cargada exitosamente",
+            "records_processed": rows,
+            "partitions_replaced": len(replaced),
+            "partitions_skipped": skipped,
+            "partitions_deleted": len(deleted),
+            "serialization": serialization,
+            "pipeline": pipelining,
+        }
+        return result, _merge_rollups(rollup_parts) if rollups else None
+    except Exception as e:
+        error_msg = f"Error al cargar datos en BigQuery: {type(e).__name__}: {str(e)}"
+        log(f"❌ {error_msg}", severity="ERROR", exc_info=True)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+@metrics.timed("intervals")
+def build_intervals(df_norm: pd.DataFrame) -> tuple:
+    """Tabla de intervalos y calendario de meses del modo de intervalos. Retorna (intervalos, meses)"""
+    intervals = build_employee_intervals(df_norm)
+    months = build_month_calendar(intervals)
+    metrics.record(rows_in=len(df_norm), rows_out=len(intervals))
+    return intervals, months
+
+@metrics.timed("load")
+def load_intervals(intervals, months, sink=None):
+    """
+    Modo de intervalos: carga una fila por empleado y el calendario de meses
+    en vez del bridge, y deja en la tabla de destino una vista que reconstruye
+    las columnas del bridge (ver views.py).
+    """
+    log("=== CARGANDO INTERVALOS A BIGQUERY ===")
+    try:
+        sink = sink or get_sink()
+        t0 = time.perf_counter()
+        intervals_table = to_arrow_table(intervals, INTERVAL_ARROW_SCHEMA)
+        months_table = to_arrow_table(months, MONTH_ARROW_SCHEMA)
+        serialize_seconds = time.perf_counter() - t0
+
+        upload_bytes = sink.write_intervals(intervals_table, months_table)
+        serialization = {
+            "serialize_seconds": round(serialize_seconds, 3),
+            "arrow_bytes": intervals_table.nbytes + months_table.nbytes,
+            "upload_bytes": upload_bytes,
+        }
+        metrics.record(rows_in=len(intervals), bytes=upload_bytes)
+        log(f"✅ Intervalos cargados exitosamente. {len(intervals)} empleados, {len(months)} meses, "
+            f"vista del bridge en {sink.describe()}",
+            records=len(intervals), months=len(months), **serialization)
+        return {
+            "success": True,
+            "message": "Intervalos cargados y vista del bridge actualizada",
+            "output_mode": "intervals",
+            "records_processed": len(intervals),
+            "months": len(months),
+            "serialization": serialization
+        }
+    except Exception as e:
+        error_msg = f"Error al cargar intervalos en BigQuery: {type(e).__name__}: {str(e)}"
+        log(f"❌ {error_msg}", severity="ERROR", exc_info=True)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+@metrics.timed("rollups")
+def load_view_rollups(sink=None) -> dict:
+    """
+    Modo de intervalos: calcula las rollups de KPI en el destino sobre la
+    vista del bridge, sin expandir los empleados en la instancia.
+    """
+    try:
+        sink = sink or get_sink()
+        loaded = {}
+        for name, dims in ROLLUP_GRAINS.items():
+            loaded[name] = {"rows": sink.materialize_rollup(name, dims)}
+        for name, dims in CAUSAL_ROLLUP_GRAINS.items():
+            loaded[name] = {"rows": sink.materialize_rollup(name, dims, causal=True)}
+        metrics.record(rows_out=sum(r["rows"] for r in loaded.values()))
+        summary = ", ".join(f"{name} ({r['rows']})" for name, r in loaded.items())
+        log(f"✅ Rollups de KPI calculadas en el destino: {summary}", rollups=loaded)
+        return loaded
+    except Exception as e:
+        error_msg = f"Error al calcular rollups de KPI: {type(e).__name__}: {str(e)}"
+        log(f"❌ {error_msg}", severity="ERROR", exc_info=True)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+@metrics.timed("index")
+def publish_index(df_bridge: pd.DataFrame, payload_hash: str):
+    """
+    Construye el índice en memoria del bridge y lo publica para las consultas.
+
+    El índice nuevo se arma completo antes de reemplazar la referencia global,
+    así las consultas en curso siguen usando el anterior hasta terminar.
+    """
+    global BRIDGE_INDEX
+    if not QUERY_INDEX:
+        return None
+    index = BridgeIndex(df_bridge, BRIDGE_COLUMNS, source={
+        "sha256": payload_hash,
+        "day": str(datetime.today().date()),
+    })
+    BRIDGE_INDEX = index
+    report = index.memory_report()
+    metrics.record(rows_in=len(df_bridge))
+    log(f"🔎 Índice de consultas publicado: {report['rows']} filas, "
+        f"{report['total_bytes'] / 1024 ** 2:.1f} MB", **report)
+    return report
+
+def _publish_cached_index(payload_hash: str):
+    """
+    Publica el bridge en cache si el índice no corresponde a este payload
+    (por ejemplo, tras reiniciar) o quedó desactualizado por un delta.
+    """
+    index = BRIDGE_INDEX
+    if not QUERY_INDEX or (
+        index is not None and index.source.get("sha256") == payload_hash and not index.source.get("stale")
+    ):
+        return
+    df_bridge = _cached_bridge(payload_hash)
+    if df_bridge is not None:
+        publish_index(df_bridge, payload_hash)
+
+def _mark_index_stale(reason: str) -> bool:
+    """
+    Marca el índice publicado como desactualizado (se ve en /query/status).
+    Se reemplaza `source` en vez de modificarlo, igual que el índice completo.
+    Retorna True si había un índice que marcar.
+    """
+    index = BRIDGE_INDEX
+    if not QUERY_INDEX or index is None:
+        return False
+    index.source = {**index.source, "stale": True, "stale_reason": reason}
+    return True
+
+def _employee_text(df_norm: pd.DataFrame) -> pd.DataFrame:
+    """
+    Columnas de origen del empleado como texto.
+
+    Las categóricas se pasan por object para que sus nulos queden como 'None',
+    igual que cuando las dimensiones viajaban como strings.
+    """
+    cols = sorted(c for c in INGEST_COLUMNS if c in df_norm.columns)
+    text = df_norm[cols].copy(deep=False)
+    for c in cols:
+        if isinstance(text[c].dtype, pd.CategoricalDtype):
+            text[c] = text[c].astype(object).where(text[c].notna(), None)
+    return text.astype(str)
+
+def _employee_row_hashes(df_norm: pd.DataFrame) -> pd.Series:
+    """Hash de contenido por fila sobre las columnas de origen del empleado."""
+    return pd.util.hash_pandas_object(_employee_text(df_norm), index=False)
+
+def load_snapshot():
+    """Lee el snapshot de empleados de la última sincronización (None si no existe)."""
+    if not os.path.exists(SNAPSHOT_PATH):
+        return None, None
+    table = pq.read_table(SNAPSHOT_PATH)
+    metadata = table.schema.metadata or {}
+    snapshot_date = pd.Timestamp(metadata[b"snapshot_date"].decode())
+    return table.to_pandas(), snapshot_date
+
+@metrics.timed("snapshot")
+def save_snapshot(df_norm: pd.DataFrame, snapshot_date: pd.Timestamp):
+    """Guarda el conjunto normalizado de empleados con su hash por fila."""
+    snapshot = _employee_text(df_norm).reset_index(drop=True)
+    snapshot["_row_hash"] = _employee_row_hashes(df_norm).values
+    table = pa.Table.from_pandas(snapshot, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"snapshot_date": snapshot_date.strftime("%Y-%m-%d").encode(),
+    })
+    os.makedirs(os.path.dirname(SNAPSHOT_PATH) or ".", exist_ok=True)
+    tmp_path = f"{SNAPSHOT_PATH}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, SNAPSHOT_PATH)
+    metrics.record(rows_in=len(df_norm))
+    log(f"💾 Snapshot guardado: {len(snapshot)} empleados en {SNAPSHOT_PATH}", employees=len(snapshot))
+
+def diff_employees(old: pd.DataFrame, df_norm: pd.DataFrame) -> dict:
+    """
+    Compara el snapshot anterior con los empleados actuales por `rut`.
+
+    Un rut puede tener varias filas (recontrataciones), por lo que se comparan
+    los pares (rut, hash) con su número de ocurrencia: cualquier fila presente
+    en un solo lado marca al rut como insertado, modificado o eliminado.
+    """
+    new_pairs = pd.DataFrame({
+        "rut": df_norm["rut"].astype(str).values,
+        "_row_hash": _employee_row_hashes(df_norm).values,
+    })
+    old_pairs = old[["rut", "_row_hash"]].copy()
+    for pairs in (old_pairs, new_pairs):
+        pairs["_n"] = pairs.groupby(["rut", "_row_hash"]).cumcount()
+
+    cmp = old_pairs.merge(new_pairs, on=["rut", "_row_hash", "_n"], how="outer", indicator=True)
+    affected = set(cmp.loc[cmp["_merge"] != "both", "rut"])
+    old_ruts = set(old_pairs["rut"])
+    new_ruts = set(new_pairs["rut"])
+
+    return {
+        "inserted": sorted(affected - old_ruts),
+        "deleted": sorted(affected - new_ruts),
+        "changed": sorted(affected & old_ruts & new_ruts),
+    }
+
+@metrics.timed("bridge")
+def build_incremental_bridge(df_norm: pd.DataFrame, ruts, open_from: pd.Timestamp) -> pd.DataFrame:
+    """
+    Genera solo las filas del bridge que cambian respecto a la última carga.
+
+    Incluye todos los meses de los ruts afectados y, para el resto, los meses
+    abiertos desde `open_from` (los activos extienden su fin efectivo a hoy).
+    Los empleados sin fecha de ingreso parten en el primer mes de todo el
+    conjunto, igual que en una reconstrucción completa.
+    """
+    affected = df_norm["rut"].astype(str).isin(ruts)
+    open_employees = df_norm["_f_fin_efectivo"] >= open_from
+    subset = df_norm.loc[affected | open_employees]
+    metrics.record(rows_in=len(subset))
+    if subset.empty:
+        return pd.DataFrame(columns=BRIDGE_COLUMNS)
+
+    df_bridge = build_bridge(subset, min_month=_global_min_month(df_norm))
+    keep = df_bridge["rut"].astype(str).isin(ruts) | (df_bridge["month_start"] >= open_from)
+    df_delta = df_bridge.loc[keep, BRIDGE_COLUMNS].reset_index(drop=True)
+    metrics.record(rows_out=len(df_delta))
+    return df_delta
+
+@metrics.timed("load")
+def apply_delta_to_bigquery(df_delta: pd.DataFrame, ruts, open_from: pd.Timestamp, sink=None):
+    """Reemplaza en el destino las filas de los ruts afectados y de los meses abiertos."""
+    log("=== APLICANDO DELTA EN BIGQUERY ===")
+
+    try:
+        sink = sink or get_sink()
+        log(f"🔄 Aplicando {len(df_delta)} registros: {sink.describe()}", destination=sink.describe())
+        upload_bytes = sink.apply_delta(to_arrow_table(df_delta), ruts, open_from)
+        metrics.record(rows_in=len(df_delta), bytes=upload_bytes)
+        log(f"✅ Delta aplicado: {len(df_delta)} registros, {len(ruts)} ruts afectados, "
+            f"{upload_bytes} bytes subidos", records=len(df_delta), ruts=len(ruts), upload_bytes=upload_bytes)
+    except Exception as e:
+        error_msg = f"Error al aplicar delta en BigQuery: {type(e).__name__}: {str(e)}"
+        log(f"❌ {error_msg}", severity="ERROR", exc_info=True)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+def sync_incremental_to_bigquery(force_refresh=False, filters=None):
+    """
+    Sincronización incremental: aplica solo los cambios desde el último snapshot.
+
+    Si no hay snapshot previo se hace una carga completa y se guarda el snapshot
+    para las siguientes ejecuciones. Con filtros distintos a DEFAULT_FILTERS se
+    hace una carga completa: el snapshot corresponde a los filtros por defecto.
+    Cada carga completa en lugar de la incremental indica el motivo en `reason`.
+    """
+    log("=== INICIANDO SINCRONIZACIÓN INCREMENTAL ===")
+    run_date = pd.Timestamp(datetime.today().date())
+
+    if len(configured_sources()) > 1:
+        # El snapshot y el delta se identifican por rut, que puede repetirse entre tenants
+        log("⚠️ La sincronización incremental no aplica a varias fuentes, se realiza carga completa",
+            severity="WARNING")
+        return {**sync_to_bigquery(force_refresh, filters), "mode": "full", "reason": "multiple_sources"}
+    if OUTPUT_MODE == "intervals":
+        # La tabla de intervalos es una fila por empleado: se reemplaza completa
+        log("La sincronización incremental no aplica al modo intervals, se realiza carga completa")
+        return {**sync_to_bigquery(force_refresh, filters), "mode": "full", "reason": "intervals"}
+    if bridge_filters(filters) != DEFAULT_FILTERS:
+        log("La sincronización incremental no aplica con filtros, se realiza carga completa")
+        return {**sync_to_bigquery(force_refresh, filters), "mode": "full", "reason": "filters"}
+
+    downloaded, payload_hash, sources = download_sources(force_refresh)
+    sink = get_sink()
+    if not force_refresh and _payload_unchanged(sink, payload_hash):
+        _publish_cached_index(payload_hash)
+        return _skipped_result()
+
+    df_norm = read_sources(downloaded, sources)
+    if df_norm is None:
+        return load_to_bigquery(None)
+
+    old, snapshot_date = load_snapshot()
+    if old is None:
+        # En Cloud Run /tmp no sobrevive a un arranque en frío: SNAPSHOT_PATH debe apuntar a un volumen
+        log(f"⚠️ No hay snapshot previo en {SNAPSHOT_PATH}, se realiza carga completa",
+            severity="WARNING", reason="no_snapshot")
+        df_bridge = _cached_bridge(payload_hash, force_refresh)
+        if df_bridge is None:
+            df_bridge = _build_and_cache_bridge(df_norm, payload_hash)
+        result = load_to_bigquery(df_bridge, sink)
+        if KPI_ROLLUPS:
+            result["rollups"] = load_rollups(df_bridge, sink)
+        CACHE.mark_loaded(sink.describe(), payload_hash, run_date.date())
+        save_snapshot(df_norm, run_date)
+        publish_index(df_bridge, payload_hash)
+        return {**result, "mode": "full", "reason": "no_snapshot"}
+
+    diff = diff_employees(old, df_norm)
+    ruts = diff["inserted"] + diff["changed"] + diff["deleted"]
+    open_from = snapshot_date.to_period("M").to_timestamp()
+    log(f"Cambios: {len(diff['inserted'])} nuevos, {len(diff['changed'])} modificados, "
+        f"{len(diff['deleted'])} eliminados; meses abiertos desde {open_from.date()}",
+        inserted=len(diff["inserted"]), changed=len(diff["changed"]), deleted=len(diff["deleted"]),
+        open_from=open_from.date())
+
+    df_delta = build_incremental_bridge(df_norm, ruts, open_from)
+    apply_delta_to_bigquery(df_delta, ruts, open_from, sink)
+    # Las rollups y el índice necesitan el bridge completo: quedan desactualizados
+    # hasta la siguiente carga completa, que no se omite aunque el payload sea el mismo
+    stale = {"rollups": "stale"} if KPI_ROLLUPS else {}
+    if _mark_index_stale("sincronización incremental aplicada después de construir el índice"):
+        stale["index"] = "stale"
+    if stale:
+        log(f"⚠️ Desactualizados hasta la siguiente sincronización completa: {sorted(stale)}",
+            severity="WARNING", stale=sorted(stale))
+    CACHE.mark_loaded(sink.describe(), payload_hash, run_date.date(), **stale)
+    save_snapshot(df_norm, run_date)
+
+    return {
+        "success": True,
+        "message": "Delta procesado y cargado exitosamente",
+        "mode": "incremental",
+        "records_processed": len(df_delta),
+        "employees_inserted": len(diff["inserted"]),
+        "employees_changed": len(diff["changed"]),
+        "employees_deleted": len(diff["deleted"]),
+        **stale,
+    }
+
+def _skipped_result():
+    log("♻️ El payload no cambió desde la última carga de hoy, se omite el proceso", skipped=True)
+    return {
+        "success": True,
+        "message": "Payload sin cambios, no se recarga",
+        "records_processed": 0,
+        "skipped": True
+    }
+
+def _sync_intervals(df_norm, sink, payload_hash, run_date, filters=None):
+    """
+    Carga del modo de intervalos: intervalos, calendario, vista del bridge y
+    rollups calculadas en el destino.
+
+    El bridge no se construye en la instancia, así que no se publica índice
+    para /query/*. El snapshot se elimina: el destino es una vista y sobre
+    ella no se puede aplicar un delta incremental. La ventana de período no
+    aplica: los intervalos ya son una fila por empleado y se reemplazan completos.
+    """
+    if _month_window(filters) is not None:
+        log("La ventana de período no aplica al modo intervals, se cargan todos los meses")
+    intervals, months = build_intervals(df_norm)
+    result = load_intervals(intervals, months, sink)
+    if KPI_ROLLUPS:
+        result["rollups"] = load_view_rollups(sink)
+    CACHE.mark_loaded(sink.describe(), payload_hash, run_date.date(), **_load_marker(filters))
+    if os.path.exists(SNAPSHOT_PATH):
+        os.remove(SNAPSHOT_PATH)
+    return result
+
+def _sync_pipelined(df_norm, sink, payload_hash, run_date, sources, filters=None):
+    """
+    Carga del bridge por chunks (LOAD_PIPELINE=true): el bridge se genera y
+    se sube a la vez, con memoria acotada a unos pocos chunks.
+
+    Como el bridge completo no queda en memoria, no se guarda en cache ni se
+    publica índice para /query/*; las rollups se calculan por chunk.
+    """
+    window = _month_window(filters)
+    result, rollups = load_pipelined(df_norm, sink, window, rollups=KPI_ROLLUPS and window is None)
+    if rollups is not None:
+        result["rollups"] = load_rollups(None, sink, rollups)
+    elif KPI_ROLLUPS:
+        log("Rollups de KPI omitidas: la carga es de una ventana de período")
+    CACHE.mark_loaded(sink.describe(), payload_hash, run_date.date(), **_load_marker(filters))
+    default_filters = bridge_filters(filters) == DEFAULT_FILTERS
+    if len(sources) == 1 and default_filters:
+        save_snapshot(df_norm, run_date)
+    if not default_filters:
+        result["filters"] = bridge_filters(filters)
+    return result
+
+def sync_to_bigquery(force_refresh=False, filters=None):
+    """
+    Función principal para sincronizar datos con BigQuery.
+
+    `filters` (ver DEFAULT_FILTERS) se aplica sobre los empleados antes de
+    expandir a meses; con period_from/period_to solo se generan y reemplazan
+    las particiones de esa ventana.
+    """
+    log("=== INICIANDO SINCRONIZACIÓN COMPLETA ===")
+    run_date = pd.Timestamp(datetime.today().date())
+    
+    # Paso 1: Obtener y procesar datos (todas las fuentes)
+    downloaded, payload_hash, sources = download_sources(force_refresh)
+    sink = get_sink()
+    window_ignored = None
+    if _month_window(filters) is not None and OUTPUT_MODE != "intervals" and not _has_window_baseline(sink):
+        # Sin carga previa particionada la ventana borraría el resto de la tabla: se construye todo
+        log("⚠️ El destino no tiene una carga particionada previa: se ignora la ventana de período "
+            "y se hace una carga completa", severity="WARNING")
+        filters = {**bridge_filters(filters), "period_from": None, "period_to": None}
+        window_ignored = "no_baseline"
+    window = _month_window(filters)
+    default_filters = bridge_filters(filters) == DEFAULT_FILTERS
+    bridge_key = _bridge_key(payload_hash, filters)
+    if not force_refresh and _payload_unchanged(sink, payload_hash, filters):
+        _publish_cached_index(bridge_key)
+        return {**_skipped_result(), "sources": sources}
+
+    df_norm = read_sources(downloaded, sources, filters)
+    if df_norm is None:
+        return {**load_to_bigquery(None), "sources": sources}
+    if OUTPUT_MODE == "intervals":
+        return {**_sync_intervals(df_norm, sink, payload_hash, run_date, filters), "sources": sources}
+    if LOAD_PIPELINE:
+        result = _sync_pipelined(df_norm, sink, payload_hash, run_date, sources, filters)
+        if window_ignored:
+            result["window_ignored"] = window_ignored
+        return {**result, "sources": sources}
+    df_bridge = _cached_bridge(bridge_key, force_refresh)
+    if df_bridge is None:
+        df_bridge = _build_and_cache_bridge(df_norm, bridge_key, window)
+    
+    # Paso 2: Cargar a BigQuery (bridge y rollups de KPI)
+    result = load_to_bigquery(df_bridge, sink, window)
+    if KPI_ROLLUPS and window is None:
+        result["rollups"] = load_rollups(df_bridge, sink)
+    elif KPI_ROLLUPS:
+        # Las rollups se reemplazan completas: con una ventana perderían los meses fuera de ella
+        log("Rollups de KPI omitidas: la carga es de una ventana de período")
+    CACHE.mark_loaded(sink.describe(), payload_hash, run_date.date(), **_load_marker(filters))
+    
+    # Paso 3: Guardar snapshot para las sincronizaciones incrementales (una sola fuente, filtros por defecto)
+    if len(sources) == 1 and default_filters:
+        save_snapshot(df_norm, run_date)
+
+    # Paso 4: Publicar el bridge para las consultas en memoria
+    publish_index(df_bridge, bridge_key)
+    
+    result["sources"] = sources
+    if not default_filters:
+        result["filters"] = bridge_filters(filters)
+    if window_ignored:
+        result["window_ignored"] = window_ignored
+    return result
+
+def fetch_data_summary(force_refresh=False, filters=None):
+    """Obtiene y procesa los datos y resume el resultado (sin cargar a BigQuery)"""
+    df_bridge, sources = fetch_and_process_data(force_refresh, filters)
+    if df_bridge is None:
+        return {
+            "success": True,
+            "message": "No hay datos para procesar",
+            "records_processed": 0,
+            "sources": sources
+        }
+    
+    return {
+        "success": True,
+        "message": "Datos obtenidos y procesados exitosamente",
+        "records_processed": len(df_bridge),
+        "columns": list(df_bridge.columns),
+        "sample_data": _dates_for_load(df_bridge.head(3)).to_dict('records') if len(df_bridge) > 0 else [],
+        "sources": sources
+    }
@@ -0,0 +1,432 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+from views import bridge_view_sql, causal_rollup_sql, rollup_sql
+
+
+def partition_id(month_start) -> str:
+    """Identificador de partición mensual ('YYYYMM') para una fecha de inicio de mes."""
+    return pd.Timestamp(month_start).strftime("%Y%m")
+
+
+def partition_ids(table: pa.Table) -> np.ndarray:
+    """Partición ('YYYYMM') de cada fila de una tabla Arrow con `month_start` date32."""
+    months = table.column("month_start").to_numpy().astype("datetime64[M]")
+    return np.char.replace(np.datetime_as_string(months, unit="M"), "-", "")
+
+
+def split_partitions(table: pa.Table) -> dict:
+    """Separa una tabla Arrow en una subtabla por partición mensual."""
+    pids = partition_ids(table)
+    return {pid: table.filter(pa.array(pids == pid)) for pid in np.unique(pids)}
+
+
+def write_parquet(table: pa.Table, path: str) -> int:
+    """Escribe la tabla en Parquet comprimido y retorna el tamaño del archivo."""
+    pq.write_table(table, path, compression="zstd")
+    return os.path.getsize(path)
+
+
+class BigQuerySink:
+    """
+    Destino BigQuery particionado por mes sobre `month_start` y agrupado por
+    `cliente`/`instalacion`.
+
+    Los checksums de cada partición se guardan en una tabla auxiliar
+    `<tabla>__partition_checksums` para poder saltar las que no cambiaron.
+    La carga por chunks sube a `<tabla>__staging` y lo aplica al final.
+    En el modo de intervalos `<tabla>` es en cambio una vista sobre
+    `<tabla>__intervals` y `<tabla>__months`.
+    """
+
+    def __init__(self, project_id, dataset_id, table_id, client=None, artifact_dir=None):
+        self.client = client or bigquery.Client(project=project_id)
+        self.table_id = f"{project_id}.{dataset_id}.{table_id}"
+        self.checksums_id = f"{self.table_id}__partition_checksums"
+        self.intervals_id = f"{self.table_id}__intervals"
+        self.months_id = f"{self.table_id}__months"
+        self.staging_id = f"{self.table_id}__staging"
+        self.artifact_dir = artifact_dir
+
+    def _load_config(self, write_disposition="WRITE_TRUNCATE", partitioned=True, add_fields=False):
+        config = bigquery.LoadJobConfig(
+            write_disposition=write_disposition,
+            source_format=bigquery.SourceFormat.PARQUET,
+        )
+        if add_fields:
+            # Permite que una partición traiga columnas nuevas (por ejemplo `tenant`)
+            # sin recrear la tabla; BigQuery solo lo admite al cargar una partición
+            config.schema_update_options = [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+        if partitioned:
+            config.time_partitioning = bigquery.TimePartitioning(
+                type_=bigquery.TimePartitioningType.MONTH, field="month_start"
+            )
+            config.clustering_fields = ["cliente", "instalacion"]
+        return config
+
+    def _load_table(self, table: pa.Table, destination: str, job_config, name: str) -> int:
+        """
+        Serializa la tabla a Parquet y la sube con un load job desde archivo.
+
+        Si hay `artifact_dir` el archivo se conserva ahí; si no, se usa un
+        temporal. Retorna los bytes subidos.
+        """
+        if self.artifact_dir:
+            os.makedirs(self.artifact_dir, exist_ok=True)
+            path = os.path.join(self.artifact_dir, f"{name}.parquet")
+        else:
+            fd, path = tempfile.mkstemp(suffix=".parquet")
+            os.close(fd)
+        try:
+            size = write_parquet(table, path)
+            with open(path, "rb") as f:
+                self.client.load_table_from_file(f, destination, job_config=job_config).result()
+        finally:
+            if not self.artifact_dir and os.path.exists(path):
+                os.remove(path)
+        return size
+
+    def is_partitioned(self) -> bool:
+        """True si la tabla existe y ya está particionada por month_start."""
+        try:
+            table = self.client.get_table(self.table_id)
+        except Exception:
+            return False
+        partitioning = table.time_partitioning
+        return partitioning is not None and partitioning.field == "month_start"
+
+    def partitions(self) -> list:
+        try:
+            return sorted(
+                pid for pid in self.client.list_partitions(self.table_id)
+                if pid.isdigit()
+            )
+        except Exception:
+            return []
+
+    def read_checksums(self) -> dict:
+        try:
+            rows = self.client.query(
+                f"SELECT partition_id, checksum FROM `{self.checksums_id}`"
+            ).result()
+        except Exception:
+            return {}
+        return {row["partition_id"]: row["checksum"] for row in rows}
+
+    def write_checksums(self, checksums: dict):
+        df = pd.DataFrame(
+            {"partition_id": list(checksums.keys()), "checksum": list(checksums.values())}
+        )
+        job_config = bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE")
+        self.client.load_table_from_dataframe(df, self.checksums_id, job_config=job_config).result()
+
+    def write_full(self, table: pa.Table) -> int:
+        """Reemplaza la tabla completa (la crea particionada si no lo estaba)."""
+        if not self.is_partitioned():
+            # Una tabla existente sin partición no admite cambiar su especificación
+            self.client.delete_table(self.table_id, not_found_ok=True)
+        return self._load_table(table, self.table_id, self._load_config(), "full")
+
+    def replace_partition(self, pid: str, table: pa.Table) -> int:
+        return self._load_table(
+            table, f"{self.table_id}${pid}", self._load_config(add_fields=True), f"month={pid}"
+        )
+
+    def delete_partition(self, pid: str):
+        self.client.delete_table(f"{self.table_id}${pid}", not_found_ok=True)
+
+    def begin_staging(self):
+        """Vacía el staging de la carga por chunks (puede quedar de una carga fallida)."""
+        self.client.delete_table(self.staging_id, not_found_ok=True)
+
+    def stage_chunk(self, table: pa.Table, name: str) -> int:
+        """Agrega un chunk del bridge al staging (particionado igual que la tabla)."""
+        return self._load_table(
+            table, self.staging_id, self._load_config(write_disposition="WRITE_APPEND"), name
+        )
+
+    def commit_staging(self, replaced, deleted, full: bool):
+        """
+        Aplica el staging al destino en un solo paso y lo elimina.
+
+        En una carga completa el staging se copia sobre la tabla con
+        WRITE_TRUNCATE. Si no, DELETE de las particiones reemplazadas y
+        eliminadas + INSERT desde el staging dentro de una transacción.
+        """
+        if full and not self.is_partitioned():
+            # Una tabla existente sin partición no admite cambiar su especificación
+            self.client.delete_table(self.table_id, not_found_ok=True)
+        if full and replaced:
+            job_config = bigquery.CopyJobConfig(write_disposition="WRITE_TRUNCATE")
+            self.client.copy_table(self.staging_id, self.table_id, job_config=job_config).result()
+        elif replaced or deleted:
+            insert = ""
+            if replaced:
+                # Columnas explícitas: en una tabla anterior las columnas agregadas quedan al final
+                columns = ", ".join(f"`{field.name}`" for field in self.client.get_table(self.staging_id).schema)
+                insert = f"INSERT INTO `{self.table_id}` ({columns}) SELECT {columns} FROM `{self.staging_id}`;"
+            query = f"""
+            BEGIN TRANSACTION;
+            DELETE FROM `{self.table_id}` WHERE month_start IN UNNEST(@months);
+            {insert}
+            COMMIT TRANSACTION;
+            """
+            months = [date(int(pid[:4]), int(pid[4:]), 1) for pid in list(replaced) + list(deleted)]
+            query_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ArrayQueryParameter("months", "DATE", months),
+            ])
+            self.client.query(query, job_config=query_config).result()
+        self.client.delete_table(self.staging_id, not_found_ok=True)
+
+    def write_rollup(self, name: str, table: pa.Table) -> int:
+        """Reemplaza la tabla de rollup `<tabla>__kpi_<name>` (sin particionar)."""
+        return self._load_table(
+            table, f"{self.table_id}__kpi_{name}", self._load_config(partitioned=False), f"kpi_{name}"
+        )
+
+    def write_intervals(self, intervals: pa.Table, months: pa.Table) -> int:
+        """
+        Reemplaza las tablas de intervalos y de meses y deja en `<tabla>` la
+        vista que reconstruye el bridge. Si `<tabla>` era el bridge
+        materializado, se elimina junto con sus checksums (una tabla no se
+        puede reemplazar por una vista). Retorna los bytes subidos.
+        """
+        size = self._load_table(intervals, self.intervals_id, self._load_config(partitioned=False), "intervals")
+        size += self._load_table(months, self.months_id, self._load_config(partitioned=False), "months")
+        try:
+            current = self.client.get_table(self.table_id)
+        except Exception:
+            current = None
+        if current is not None and current.table_type != "VIEW":
+            self.client.delete_table(self.table_id, not_found_ok=True)
+            self.client.delete_table(self.checksums_id, not_found_ok=True)
+        view = bridge_view_sql(f"`{self.intervals_id}`", f"`{self.months_id}`", "bigquery")
+        self.client.query(f"CREATE OR REPLACE VIEW `{self.table_id}` AS {view}").result()
+        return size
+
+    def materialize_rollup(self, name: str, dims, causal=False) -> int:
+        """
+        Reemplaza la rollup `<tabla>__kpi_<name>` calculándola en BigQuery
+        sobre la vista del bridge. Retorna la cantidad de filas.
+        """
+        sql = (causal_rollup_sql if causal else rollup_sql)(f"`{self.table_id}`", dims)
+        destination = f"{self.table_id}__kpi_{name}"
+        self.client.query(f"CREATE OR REPLACE TABLE `{destination}` AS {sql}").result()
+        return self.client.get_table(destination).num_rows
+
+    def apply_delta(self, table: pa.Table, ruts, open_from: pd.Timestamp) -> int:
+        """
+        Reemplaza las filas de los ruts afectados y de los meses abiertos.
+
+        El delta se carga a una tabla de staging y luego se aplica DELETE + INSERT
+        dentro de una transacción. Los checksums de las particiones tocadas se
+        invalidan para que la siguiente carga completa las reescriba.
+        """
+        staging_id = f"{self.table_id}__delta"
+        has_rows = table.num_rows > 0
+        size = 0
+        if has_rows:
+            size = self._load_table(
+                table, staging_id, self._load_config(partitioned=False), "delta"
+            )
+
+        staging_pids = f"""
+            UNION DISTINCT
+            SELECT DISTINCT FORMAT_DATE('%Y%m', month_start) FROM `{staging_id}`""" if has_rows else ""
+        # Columnas explícitas: en una tabla anterior las columnas agregadas quedan al final
+        columns = ", ".join(f"`{name}`" for name in table.schema.names)
+        insert = f"INSERT INTO `{self.table_id}` ({columns}) SELECT {columns} FROM `{staging_id}`;" if has_rows else ""
+        query = f"""
+        CREATE TABLE IF NOT EXISTS `{self.checksums_id}` (partition_id STRING, checksum STRING);
+        BEGIN TRANSACTION;
+        DELETE FROM `{self.checksums_id}`
+        WHERE partition_id IN (
+            SELECT DISTINCT FORMAT_DATE('%Y%m', month_start) FROM `{self.table_id}`
+            WHERE rut IN UNNEST(@ruts) OR month_start >= @open_from{staging_pids}
+        );
+        DELETE FROM `{self.table_id}`
+        WHERE rut IN UNNEST(@ruts) OR month_start >= @open_from;
+        {insert}
+        COMMIT TRANSACTION;
+        """
+        query_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter("ruts", "STRING", list(ruts)),
+            bigquery.ScalarQueryParameter("open_from", "DATE", open_from.date()),
+        ])
+        self.client.query(query, job_config=query_config).result()
+        if has_rows:
+            self.client.delete_table(staging_id, not_found_ok=True)
+        return size
+
+    def describe(self) -> str:
+        return self.table_id
+
+
+class LocalSink:
+    """
+    Destino local con la misma interfaz que BigQuerySink, para pruebas sin GCP.
+
+    Cada partición mensual es un archivo Parquet `month=YYYYMM.parquet` dentro
+    de `root/<tabla>` y los checksums se guardan en `_checksums.json`. Las
+    rollups de KPI van en `root/<tabla>__kpi_<nombre>.parquet` y el staging de
+    la carga por chunks en `root/<tabla>__staging`.
+
+    En el modo de intervalos se escriben `root/<tabla>__intervals.parquet` y
+    `root/<tabla>__months.parquet`, y la vista del bridge se crea en la base
+    DuckDB `root/<tabla>.duckdb` (requiere el paquete `duckdb`).
+    """
+
+    def __init__(self, root, table_id="rotacion"):
+        self.root = root
+        self.table_id = table_id
+        self.path = os.path.join(root, table_id)
+        self.checksums_path = os.path.join(self.path, "_checksums.json")
+        self.database_path = os.path.join(root, f"{table_id}.duckdb")
+        self.staging_path = f"{self.path}__staging"
+        os.makedirs(self.path, exist_ok=True)
+
+    def _duckdb(self):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise RuntimeError("El modo de intervalos con destino local requiere el paquete duckdb") from e
+        return duckdb.connect(self.database_path)
+
+    def _partition_path(self, pid: str) -> str:
+        return os.path.join(self.path, f"month={pid}.parquet")
+
+    def partitions(self) -> list:
+        return sorted(
+            name[len("month="):-len(".parquet")]
+            for name in os.listdir(self.path)
+            if name.startswith("month=") and name.endswith(".parquet")
+        )
+
+    def is_partitioned(self) -> bool:
+        return True
+
+    def read_checksums(self) -> dict:
+        if not os.path.exists(self.checksums_path):
+            return {}
+        with open(self.checksums_path) as f:
+            return json.load(f)
+
+    def write_checksums(self, checksums: dict):
+        with open(self.checksums_path, "w") as f:
+            json.dump(checksums, f, indent=2, sort_keys=True)
+
+    def write_full(self, table: pa.Table) -> int:
+        for pid in self.partitions():
+            self.delete_partition(pid)
+        # Igual que en BigQuery, el bridge materializado reemplaza a la vista
+        if os.path.exists(self.database_path):
+            os.remove(self.database_path)
+        return sum(
+            self.replace_partition(pid, part)
+            for pid, part in split_partitions(table).items()
+        )
+
+    def replace_partition(self, pid: str, table: pa.Table) -> int:
+        return write_parquet(table, self._partition_path(pid))
+
+    def delete_partition(self, pid: str):
+        if os.path.exists(self._partition_path(pid)):
+            os.remove(self._partition_path(pid))
+
+    def begin_staging(self):
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+        os.makedirs(self.staging_path)
+
+    def stage_chunk(self, table: pa.Table, name: str) -> int:
+        # Los chunks son rangos de meses disjuntos: cada partición llega en un solo chunk
+        return sum(
+            write_parquet(part, os.path.join(self.staging_path, f"month={pid}.parquet"))
+            for pid, part in split_partitions(table).items()
+        )
+
+    def commit_staging(self, replaced, deleted, full: bool):
+        """Mueve las particiones del staging al destino (os.replace, atómico por archivo)."""
+        if full and os.path.exists(self.database_path):
+            os.remove(self.database_path)
+        for pid in replaced:
+            os.replace(os.path.join(self.staging_path, f"month={pid}.parquet"), self._partition_path(pid))
+        for pid in deleted:
+            self.delete_partition(pid)
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+
+    def write_rollup(self, name: str, table: pa.Table) -> int:
+        return write_parquet(table, os.path.join(self.root, f"{self.table_id}__kpi_{name}.parquet"))
+
+    def write_intervals(self, intervals: pa.Table, months: pa.Table) -> int:
+        for pid in self.partitions():
+            self.delete_partition(pid)
+        if os.path.exists(self.checksums_path):
+            os.remove(self.checksums_path)
+        size = 0
+        with self._duckdb() as con:
+            for suffix, table in (("intervals", intervals), ("months", months)):
+                path = os.path.abspath(os.path.join(self.root, f"{self.table_id}__{suffix}.parquet"))
+                size += write_parquet(table, path)
+                con.execute(f'CREATE OR REPLACE VIEW "{self.table_id}__{suffix}" AS SELECT * FROM read_parquet(\'{path}\')')
+            view = bridge_view_sql(f'"{self.table_id}__intervals"', f'"{self.table_id}__months"', "duckdb")
+            con.execute(f'CREATE OR REPLACE VIEW "{self.table_id}" AS {view}')
+        return size
+
+    def materialize_rollup(self, name: str, dims, causal=False) -> int:
+        sql = (causal_rollup_sql if causal else rollup_sql)(f'"{self.table_id}"', dims)
+        path = os.path.abspath(os.path.join(self.root, f"{self.table_id}__kpi_{name}.parquet"))
+        with self._duckdb() as con:
+            return con.execute(f"COPY ({sql}) TO '{path}' (FORMAT PARQUET, COMPRESSION ZSTD)").fetchone()[0]
+
+    def read_view(self) -> pd.DataFrame:
+        """Lee la vista del bridge del modo de intervalos como un DataFrame."""
+        with self._duckdb() as con:
+            return con.execute(f'SELECT * FROM "{self.table_id}"').df()
+
+    def read_table(self) -> pd.DataFrame:
+        """Lee todas las particiones como un solo DataFrame."""
+        parts = [pq.read_table(self._partition_path(pid)) for pid in self.partitions()]
+        return pa.concat_tables(parts).to_pandas() if parts else pd.DataFrame()
+
+    def apply_delta(self, table: pa.Table, ruts, open_from: pd.Timestamp) -> int:
+        ruts = pa.array(sorted(set(ruts)), type=pa.string())
+        open_pid = partition_id(open_from)
+        checksums = self.read_checksums()
+        delta_parts = split_partitions(table) if table.num_rows else {}
+        size = 0
+
+        for pid in sorted(set(self.partitions()) | set(delta_parts)):
+            parts = []
+            if os.path.exists(self._partition_path(pid)):
+                current = pq.read_table(self._partition_path(pid))
+                if pid >= open_pid:
+                    drop = pa.array(np.ones(current.num_rows, dtype=bool))
+                else:
+                    drop = pc.is_in(pc.cast(current.column("rut"), pa.string()), value_set=ruts)
+                if not pc.any(drop).as_py() and pid not in delta_parts:
+                    continue
+                parts.append(current.filter(pc.invert(drop)))
+            if pid in delta_parts:
+                parts.append(delta_parts[pid])
+
+            merged = pa.concat_tables(parts)
+            if merged.num_rows == 0:
+                self.delete_partition(pid)
+            else:
+                size += self.replace_partition(pid, merged)
+            checksums.pop(pid, None)
+        self.write_checksums(checksums)
+        return size
+
+    def describe(self) -> str:
+        return self.path
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# pipeline lee la configuración al importarse: la cache, el snapshot y el
+# destino local van a una carpeta temporal, nunca a /tmp/carga_rotacion
+_WORKDIR = tempfile.mkdtemp(prefix="rotacion_tests_")
+os.environ.update({
+    "CACHE_DIR": os.path.join(_WORKDIR, "cache"),
+    "SNAPSHOT_PATH": os.path.join(_WORKDIR, "snapshot.parquet"),
+    "LOCAL_SINK_DIR": os.path.join(_WORKDIR, "sink"),
+    "LOAD_SINK": "local",
+    "TOKEN_CR": "test",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+import pipeline  # noqa: E402
+
+
+@pytest.fixture
+def employees() -> pd.DataFrame:
+    """
+    Reporte de ControlRoll ya decodificado con los casos borde del bridge:
+    finiquitos, reingresos (mismo rut), finiquito nulo, ingreso nulo, fechas
+    en el borde de mes y los dos formatos de fecha.
+    """
+    rows = [
+        # rut, tipo, fecha de ingreso, fecha de finiquito, código y texto de la causal
+        ("1-9", "FULL TIME", "2019-03-15", None, None, None),
+        ("2-7", "FULL TIME", "2020-01-31", "2020-02-01", "4", "Renuncia"),
+        ("3-5", "FULL TIME", "", "2021-06-30", "161", "Necesidades de la empresa"),
+        ("4-3", "FULL TIME", "2019-01-01", "2019-12-31", "4", "Renuncia"),
+        ("4-3", "FULL TIME", "01-03-2020", None, None, None),
+        ("5-1", "PART TIME", "2022-02-28", "2022-02-28", "161", "Necesidades de la empresa"),
+        ("6-K", "PART TIME", "15-07-2021", "31-01-2023", "2", "Vencimiento del plazo"),
+        ("7-8", "FULL TIME", "2018-12-01", "2019-01-01", "9999", "Inactivar sin Movimiento"),
+        ("8-6", "PART TIME BOLETA", "2020-05-04", None, None, None),
+    ]
+    df = pd.DataFrame(rows, columns=[
+        "rut", "tipo_empleado", "fecha_de_ingreso", "fecha_finiquito",
+        "cod_causal_finiquito", "causal_finiquito",
+    ])
+    df["nombre_completo"] = "Empleado " + df["rut"]
+    df["cliente"] = "Cliente A"
+    df["cecos"] = ["C1", "C1", "C2", "C2", "C2", "C3", "C3", "C1", "C1"]
+    df["cecosorigen"] = df["cecos"]
+    df["cargo"] = "Guardia"
+    df["estado"] = ["ACTIVO" if f is None else "FINIQUITADO" for f in df["fecha_finiquito"]]
+    df["instalacion"] = "Planta"
+    return df
+
+
+@pytest.fixture
+def df_norm(employees) -> pd.DataFrame:
+    """Empleados filtrados y normalizados como los recibe build_bridge."""
+    return pipeline.prepare_employees(employees, tenant="acme")
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import pipeline
+
+# Columnas que genera el algoritmo original (sin `tenant`, que llegó después)
+CROSS_JOIN_COLUMNS = [
+    "rut", "nombre_completo", "cliente", "cecos", "cecosorigen", "cargo", "tipo_empleado", "estado",
+    "instalacion", "_f_ingreso", "_f_finiquito", "_f_fin_efectivo", "month_start", "month_end", "period",
+    "days_in_month", "active_days", "active_ratio", "active_on_month_start", "active_on_month_end",
+    "hire_in_month", "term_in_month", "term_causal_code", "term_causal_text",
+]
+DATE_COLUMNS = ["_f_ingreso", "_f_finiquito", "_f_fin_efectivo", "month_start", "month_end"]
+INT_COLUMNS = [
+    "days_in_month", "active_days", "active_on_month_start", "active_on_month_end",
+    "hire_in_month", "term_in_month",
+]
+
+
+def _cross_join_bridge(df: pd.DataFrame) -> pd.DataFrame:
+    """Algoritmo original: cruce completo empleado × calendario y descarte de los meses sin días activos."""
+    df = df.copy()
+
+    min_month = pd.to_datetime(min(df["_f_ingreso"])).to_period("M").to_timestamp()
+    max_month = pd.to_datetime(max(df["_f_fin_efectivo"])).to_period("M").to_timestamp()
+
+    months = pd.DataFrame({
+        "month_start": pd.date_range(min_month, max_month, freq="MS")
+    })
+    months["month_end"] = (months["month_start"] + pd.offsets.MonthEnd(0)).dt.date
+    months["month_start"] = months["month_start"].dt.date
+    months["days_in_month"] = (
+        pd.to_datetime(months["month_end"]) - pd.to_datetime(months["month_start"])
+    ).dt.days + 1
+
+    df["_key"] = 1
+    months["_key"] = 1
+    x = df.merge(months, on="_key", how="outer")
+
+    start_ovl = pd.DataFrame({
+        "a": pd.to_datetime(x["_f_ingreso"]),
+        "b": pd.to_datetime(x["month_start"])
+    }).max(axis=1)
+    end_ovl = pd.DataFrame({
+        "a": pd.to_datetime(x["_f_fin_efectivo"]),
+        "b": pd.to_datetime(x["month_end"])
+    }).min(axis=1)
+
+    active_days = (end_ovl - start_ovl).dt.days + 1
+    x["active_days"] = active_days.clip(lower=0).fillna(0).astype(int)
+
+    x = x[x["active_days"] > 0].copy()
+
+    x["active_on_month_start"] = (
+        (pd.to_datetime(x["_f_ingreso"]) <= pd.to_datetime(x["month_start"])) &
+        (pd.to_datetime(x["_f_fin_efectivo"]) >= pd.to_datetime(x["month_start"]))
+    ).astype(int)
+
+    x["active_on_month_end"] = (
+        (pd.to_datetime(x["_f_ingreso"]) <= pd.to_datetime(x["month_end"])) &
+        (pd.to_datetime(x["_f_fin_efectivo"]) >= pd.to_datetime(x["month_end"]))
+    ).astype(int)
+
+    f_ing_m = pd.to_datetime(x["_f_ingreso"]).dt.to_period("M").dt.to_timestamp()
+    f_out_m = pd.to_datetime(x["_f_finiquito"]).dt.to_period("M").dt.to_timestamp()
+    month_start_ts = pd.to_datetime(x["month_start"]).dt.to_period("M").dt.to_timestamp()
+
+    x["hire_in_month"] = ((~pd.isna(x["_f_ingreso"])) & (f_ing_m == month_start_ts)).astype(int)
+    x["term_in_month"] = ((~pd.isna(x["_f_finiquito"])) & (f_out_m == month_start_ts)).astype(int)
+
+    x["term_causal_code"] = np.where(x["term_in_month"].eq(1), x["cod_causal_finiquito"], pd.NA)
+    x["term_causal_text"] = np.where(x["term_in_month"].eq(1), x["causal_finiquito"], pd.NA)
+
+    x["active_ratio"] = x["active_days"] / x["days_in_month"]
+    x["period"] = pd.to_datetime(x["month_start"]).dt.strftime("%Y-%m")
+    return x[CROSS_JOIN_COLUMNS]
+
+
+def _comparable(df: pd.DataFrame) -> pd.DataFrame:
+    """Mismas columnas con tipos comparables (fechas datetime64, enteros int64, nulos None), ordenadas."""
+    out = df[CROSS_JOIN_COLUMNS].copy()
+    for col in out.columns:
+        if col in DATE_COLUMNS:
+            out[col] = pd.to_datetime(out[col])
+        elif col in INT_COLUMNS:
+            out[col] = out[col].astype(np.int64)
+        elif col != "active_ratio":
+            out[col] = out[col].astype(object).where(out[col].notna(), None)
+    out = out.sort_values(["rut", "_f_ingreso", "period"], kind="stable", na_position="first")
+    return out.reset_index(drop=True)
+
+
+def test_expansion_matches_cross_join(df_norm):
+    # El primer empleado tiene fecha de ingreso: min() del algoritmo original no toma el NaT
+    assert pd.notna(df_norm["_f_ingreso"].iloc[0])
+    assert df_norm["_f_ingreso"].isna().any() and df_norm["_f_finiquito"].isna().any()
+    assert df_norm["rut"].duplicated().any()
+
+    expected = _cross_join_bridge(df_norm)
+    bridge = pipeline.build_employee_month_bridge(df_norm)
+
+    pd.testing.assert_frame_equal(_comparable(bridge), _comparable(expected))
+
+
+def test_expansion_respects_month_boundaries(df_norm):
+    bridge = pipeline.build_employee_month_bridge(df_norm).set_index(["rut", "period"])
+
+    # Ingreso el último día del mes y finiquito el primero del siguiente: un día en cada mes
+    assert bridge.loc[("2-7", "2020-01"), "active_days"] == 1
+    assert bridge.loc[("2-7", "2020-02"), "active_days"] == 1
+    assert bridge.loc[("2-7", "2020-02"), "term_causal_text"] == "Renuncia"
+    # Ingreso y finiquito el mismo día
+    assert bridge.loc[("5-1", "2022-02"), ["hire_in_month", "term_in_month", "active_days"]].tolist() == [1, 1, 1]
+    # Sin fecha de ingreso se parte del primer mes global
+    assert bridge.loc["3-5"].index.min() == "2019-01"
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+@pytest.mark.parametrize("filters", [None, {"period_from": "2020-01", "period_to": "2020-12"}])
+def test_parallel_matches_single_process(df_norm, executor, filters):
+    window = pipeline._month_window(filters)
+    # shard_size=1: más shards que 2 * workers, así se ejercita el envío acotado
+    expected = pipeline.build_employee_month_bridge(df_norm, window=window)
+    bridge = pipeline.build_employee_month_bridge_parallel(df_norm, 2, 1, executor, window=window)
+
+    pd.testing.assert_frame_equal(bridge, expected)
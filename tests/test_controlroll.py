@@ -0,0 +1,110 @@
+import gzip
+import json
+
+import pytest
+import requests
+
+import pipeline
+from benchmark import serve_payload
+from cache import PayloadCache
+from controlroll import ControlRollClient
+
+BODY = json.dumps([{"RUT": f"{i}-0", "NOMBRE COMPLETO": "x" * 40} for i in range(5000)]).encode()
+ETAG = '"v1"'
+
+
+@pytest.fixture
+def serve():
+    """serve_payload que apaga los servidores al terminar la prueba."""
+    servers = []
+
+    def start(**kwargs):
+        server, url = serve_payload(BODY, **kwargs)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _client(retries=3) -> ControlRollClient:
+    # Bloques chicos para que lo recibido antes de un corte alcance a escribirse
+    return ControlRollClient(connect_timeout=5, read_timeout=5, retries=retries,
+                             backoff_seconds=0, chunk_size=16 * 1024)
+
+
+def _received(part_path) -> bytes:
+    with gzip.open(part_path, "rb") as f:
+        return f.read()
+
+
+def test_retries_on_503(serve, tmp_path):
+    server, url = serve(fail_first=2)
+    part = str(tmp_path / "payload.part")
+
+    result = _client().download(url, {"method": "report"}, part)
+
+    assert result["status"] == "downloaded"
+    assert result["attempts"] == 3
+    assert len(server.requests) == 3
+    assert result["received_bytes"] == len(BODY)
+    assert _received(part) == BODY
+
+
+def test_gives_up_after_retries(serve, tmp_path):
+    server, url = serve(fail_first=5)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        _client(retries=1).download(url, {"method": "report"}, str(tmp_path / "payload.part"))
+    assert len(server.requests) == 2
+
+
+def test_resumes_with_range_after_a_cut(serve, tmp_path):
+    server, url = serve(etag=ETAG, truncate_first=1)
+    part = str(tmp_path / "payload.part")
+
+    result = _client().download(url, {"method": "report"}, part)
+
+    assert result["attempts"] == 2
+    resumed = server.requests[1]
+    start = int(resumed["Range"].split("=")[1].rstrip("-"))
+    assert 0 < start < len(BODY)
+    assert resumed["If-Range"] == ETAG
+    # Lo recibido antes y después del corte se cuenta una sola vez
+    assert result["resumed_bytes"] == 0
+    assert result["received_bytes"] == len(BODY)
+    assert _received(part) == BODY
+
+
+def test_resumes_in_a_later_run(serve, tmp_path):
+    server, url = serve(etag=ETAG, truncate_first=1)
+    part = str(tmp_path / "payload.part")
+
+    with pytest.raises(requests.exceptions.RequestException):
+        _client(retries=0).download(url, {"method": "report"}, part)
+    result = _client().download(url, {"method": "report"}, part)
+
+    start = int(server.requests[1]["Range"].split("=")[1].rstrip("-"))
+    assert result["resumed_bytes"] == start > 0
+    assert result["received_bytes"] == len(BODY) - start
+    assert _received(part) == BODY
+
+
+def test_not_modified_reuses_cached_payload(serve, tmp_path, monkeypatch):
+    server, url = serve(etag=ETAG)
+    monkeypatch.setattr(pipeline, "CACHE", PayloadCache(str(tmp_path / "cache"), 3600))
+    monkeypatch.setattr(pipeline, "CONTROLROLL", _client())
+    source = {"tenant": "acme", "url": url, "token": "test"}
+
+    first = pipeline.download_payload(source=source)
+    cached = pipeline.download_payload(source=source)
+    refreshed = pipeline.download_payload(force_refresh=True, source=source)
+
+    # La segunda llamada usa la cache sin pedir; la tercera pide con If-None-Match y recibe 304
+    assert len(server.requests) == 2
+    assert server.requests[1]["If-None-Match"] == ETAG
+    assert cached["sha256"] == refreshed["sha256"] == first["sha256"]
+    assert refreshed["path"] == first["path"]
+    assert b"".join(PayloadCache.iter_payload(refreshed, 64 * 1024)) == BODY
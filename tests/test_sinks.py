@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+import pipeline
+from sinks import LocalSink
+
+DIMENSIONS = [
+    "period", "tenant", "rut", "cliente", "instalacion", "cecos", "cargo", "nombre_completo",
+    "tipo_empleado", "estado", "term_causal_text",
+]
+
+
+def _comparable(df: pd.DataFrame) -> pd.DataFrame:
+    """Columnas del bridge con tipos comparables entre Parquet y DuckDB, ordenadas por empleado y mes."""
+    out = df[pipeline.BRIDGE_COLUMNS].copy()
+    for col in out.columns:
+        if col in DIMENSIONS:
+            out[col] = out[col].astype(object).where(out[col].notna(), None)
+        elif col in ("_f_ingreso", "_f_finiquito", "month_start", "month_end"):
+            out[col] = pd.to_datetime(out[col])
+        elif col == "active_ratio":
+            out[col] = out[col].astype(np.float64)
+        else:
+            out[col] = out[col].astype(np.int64)
+    out = out.sort_values(["tenant", "rut", "_f_ingreso", "period"], kind="stable", na_position="first")
+    return out.reset_index(drop=True)
+
+
+def test_interval_view_matches_materialized_bridge(df_norm, tmp_path):
+    pytest.importorskip("duckdb")
+    materialized = LocalSink(str(tmp_path / "bridge"))
+    pipeline.load_to_bigquery(pipeline.build_employee_month_bridge(df_norm), materialized)
+
+    view = LocalSink(str(tmp_path / "intervals"))
+    intervals, months = pipeline.build_intervals(df_norm)
+    pipeline.load_intervals(intervals, months, view)
+
+    pd.testing.assert_frame_equal(
+        _comparable(view.read_view()), _comparable(materialized.read_table()),
+        check_exact=False, rtol=1e-6,
+    )
+
+
+@pytest.fixture
+def bridge(df_norm) -> pd.DataFrame:
+    return pipeline.build_employee_month_bridge(df_norm)
+
+
+@pytest.fixture
+def sink(tmp_path) -> LocalSink:
+    return LocalSink(str(tmp_path / "sink"))
+
+
+def _mtimes(sink: LocalSink) -> dict:
+    return {pid: os.stat(sink._partition_path(pid)).st_mtime_ns for pid in sink.partitions()}
+
+
+def test_first_load_writes_every_partition(bridge, sink):
+    result = pipeline.load_to_bigquery(bridge, sink)
+
+    pids = sorted(bridge["month_start"].dt.strftime("%Y%m").unique())
+    assert sink.partitions() == pids
+    assert sorted(sink.read_checksums()) == pids
+    assert result["partitions_replaced"] == len(pids)
+    assert len(sink.read_table()) == len(bridge)
+
+
+def test_unchanged_partitions_are_skipped(bridge, sink):
+    pipeline.load_to_bigquery(bridge, sink)
+    before = _mtimes(sink)
+
+    result = pipeline.load_to_bigquery(bridge, sink)
+
+    assert result["partitions_replaced"] == 0
+    assert result["partitions_skipped"] == len(before)
+    assert result["partitions_deleted"] == 0
+    assert _mtimes(sink) == before
+
+
+def test_only_changed_partition_is_replaced(bridge, sink):
+    pipeline.load_to_bigquery(bridge, sink)
+    checksums = sink.read_checksums()
+    before = _mtimes(sink)
+
+    changed = bridge.copy()
+    changed.loc[(changed["rut"] == "2-7") & (changed["period"] == "2020-02"), "estado"] = "REINGRESO"
+    result = pipeline.load_to_bigquery(changed, sink)
+
+    assert result["partitions_replaced"] == 1
+    assert result["partitions_skipped"] == len(before) - 1
+    after = _mtimes(sink)
+    assert [pid for pid in before if after[pid] != before[pid]] == ["202002"]
+    assert {pid: c for pid, c in sink.read_checksums().items() if checksums[pid] != c}.keys() == {"202002"}
+    table = sink.read_table()
+    assert table.loc[(table["rut"] == "2-7") & (table["period"] == "2020-02"), "estado"].tolist() == ["REINGRESO"]
+
+
+def test_partitions_without_rows_are_deleted(bridge, sink):
+    pipeline.load_to_bigquery(bridge, sink)
+
+    result = pipeline.load_to_bigquery(bridge[bridge["period"] >= "2019-07"], sink)
+
+    gone = [f"2019{month:02d}" for month in range(1, 7)]
+    assert result["partitions_deleted"] == len(gone)
+    assert not set(gone) & set(sink.partitions())
+    assert not set(gone) & set(sink.read_checksums())
+    assert sink.read_table()["period"].astype(str).min() == "2019-07"
+
+
+def test_window_load_only_touches_its_partitions(df_norm, bridge, sink):
+    window = pipeline._month_window({"period_from": "2020-01", "period_to": "2020-12"})
+    windowed = pipeline.build_employee_month_bridge(df_norm, window=window)
+
+    # Sin una carga completa previa la ventana no puede cargarse sin borrar el resto de los meses
+    with pytest.raises(HTTPException):
+        pipeline.load_to_bigquery(windowed, sink, window=window)
+    assert sink.partitions() == []
+
+    pipeline.load_to_bigquery(bridge, sink)
+    checksums = sink.read_checksums()
+    before = _mtimes(sink)
+
+    result = pipeline.load_to_bigquery(windowed, sink, window=window)
+
+    assert result["partitions_replaced"] == 0
+    assert result["partitions_skipped"] == 12
+    assert result["partitions_deleted"] == 0
+    assert _mtimes(sink) == before
+    assert sink.read_checksums() == checksums
@@ -0,0 +1,100 @@
+"""
+SQL de la vista que reconstruye el bridge empleado×mes a partir de la tabla
+compacta de intervalos (una fila por empleado) y del calendario de meses, y
+de las rollups de KPI calculadas sobre esa vista.
+
+Se genera en dialecto BigQuery o DuckDB (destino local); solo cambian las
+funciones de fecha.
+"""
+
+# Funciones de fecha por dialecto: inicio de mes de una fecha y días entre dos fechas (fin, inicio)
+DIALECTS = {
+    "bigquery": {
+        "month": "DATE_TRUNC({0}, MONTH)",
+        "days": "DATE_DIFF({0}, {1}, DAY)",
+    },
+    "duckdb": {
+        "month": "CAST(date_trunc('month', {0}) AS DATE)",
+        "days": "date_diff('day', {1}, {0})",
+    },
+}
+
+# Columnas de empleado que la vista toma de la tabla de intervalos, en el orden del bridge
+EMPLOYEE_COLUMNS = [
+    "tenant", "rut", "cliente", "instalacion", "cecos", "cargo", "nombre_completo", "tipo_empleado",
+    "estado", "_f_ingreso", "_f_finiquito",
+]
+
+
+def bridge_view_sql(intervals: str, months: str, dialect: str = "bigquery") -> str:
+    """
+    SELECT que expande cada intervalo a sus meses y calcula las mismas
+    columnas (y en el mismo orden) que BRIDGE_COLUMNS.
+
+    Replica build_employee_month_bridge: cada empleado se cruza con los meses
+    entre `first_month` (mes de ingreso, o el primer mes global si no tiene
+    fecha de ingreso) y el mes de `_f_fin_efectivo`, y se descartan los meses
+    sin días activos. `intervals` y `months` son referencias ya citadas.
+    """
+    month = DIALECTS[dialect]["month"].format
+    days = DIALECTS[dialect]["days"].format
+    employee = ", ".join(EMPLOYEE_COLUMNS)
+    active_start = "GREATEST(COALESCE(e._f_ingreso, m.month_start), m.month_start)"
+    active_end = "LEAST(e._f_fin_efectivo, m.month_end)"
+    return f"""
+WITH expanded AS (
+  SELECT
+    e.*, m.period, m.month_start, m.month_end, m.days_in_month,
+    {days(active_end, active_start)} + 1 AS active_days
+  FROM {intervals} AS e
+  JOIN {months} AS m
+    ON m.month_start BETWEEN e.first_month AND {month("e._f_fin_efectivo")}
+)
+SELECT
+  period, {employee},
+  month_start, month_end, days_in_month, active_days,
+  active_days / days_in_month AS active_ratio,
+  CASE WHEN _f_ingreso <= month_start AND _f_fin_efectivo >= month_start THEN 1 ELSE 0 END AS active_on_month_start,
+  CASE WHEN _f_ingreso <= month_end AND _f_fin_efectivo >= month_end THEN 1 ELSE 0 END AS active_on_month_end,
+  CASE WHEN {month("_f_ingreso")} = month_start THEN 1 ELSE 0 END AS hire_in_month,
+  CASE WHEN {month("_f_finiquito")} = month_start THEN 1 ELSE 0 END AS term_in_month,
+  CASE WHEN {month("_f_finiquito")} = month_start THEN causal_finiquito END AS term_causal_text
+FROM expanded
+WHERE active_days > 0
+"""
+
+
+def rollup_sql(bridge: str, dims) -> str:
+    """
+    KPI mensuales por `dims` sobre la vista del bridge, con las mismas
+    columnas que las rollups calculadas en memoria (ver `kpi_aggregate`).
+
+    Como el groupby en memoria, omite las filas con alguna dimensión nula.
+    """
+    keys = ", ".join(["period", "month_start"] + list(dims))
+    not_null = " AND ".join(f"{dim} IS NOT NULL" for dim in dims)
+    headcount = "SUM(active_on_month_start) + SUM(active_on_month_end)"
+    return f"""
+SELECT
+  {keys},
+  CAST(SUM(active_on_month_start) AS BIGINT) AS headcount_start,
+  CAST(SUM(active_on_month_end) AS BIGINT) AS headcount_end,
+  CAST(SUM(hire_in_month) AS BIGINT) AS hires,
+  CAST(SUM(term_in_month) AS BIGINT) AS terminations,
+  SUM(active_ratio) AS fte,
+  CASE WHEN {headcount} > 0 THEN SUM(term_in_month) / (({headcount}) / 2) END AS rotation_rate
+FROM {bridge}
+WHERE {not_null}
+GROUP BY {keys}
+"""
+
+
+def causal_rollup_sql(bridge: str, dims) -> str:
+    """Finiquitos por mes, `dims` y causal sobre la vista del bridge (incluye dimensiones nulas)."""
+    keys = ", ".join(["period", "month_start"] + list(dims) + ["term_causal_text"])
+    return f"""
+SELECT {keys}, COUNT(*) AS terminations
+FROM {bridge}
+WHERE term_in_month = 1
+GROUP BY {keys}
+"""